@@ -11,8 +11,20 @@
 # It compiles and analyses them, performs unit tests and produces statistics on the models
 # ability to produce efficient code.
 
+import hashlib
+import inspect
 import json
+import math
+import os
 import re
+import sys
+
+from archive import isArchive, readMember
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from store import openStore, iterResults, storedModels, writeMetrics, iterMetrics, storePath
+
+analyzeWorkers = os.cpu_count() or 1
 
 gravity = {
     "storage-abiencoderv2-array": "High",
@@ -110,119 +122,216 @@ gravity = {
     "public-variable-read-in-external-context": "Optimization",
 }
 
-def verify_elements(dictionary, vulnerabilities):
-    for vulnerability in vulnerabilities:
-        if vulnerability not in dictionary or dictionary[vulnerability] not in ["Optimization", "Informational"]:
+# Every "Reference:" link printed by Slither, the anchor is the detector documentation id
+detectorPattern = re.compile(r'https://github\.com/crytic/slither/wiki/Detector-Documentation#([\w-]+)', re.IGNORECASE)
+detectorGravity = {d.lower(): gravity[d] for d in gravity}
+
+def slitherFindings(slither):
+    # Number of findings per gravity, in one pass over the Slither output. The output of
+    # slither --json - is used when available, its findings carry their impact.
+    findings = Counter()
+
+    if slither.get('stdout', '').startswith('{'):
+        try:
+            for detector in json.loads(slither['stdout']).get("results", {}).get("detectors", []):
+                findings[detector["impact"]] += 1
+            return findings
+        except (ValueError, KeyError, AttributeError):
+            findings = Counter()
+
+    for d in detectorPattern.findall(slither['stderr']):
+        if d.lower() in detectorGravity:
+            findings[detectorGravity[d.lower()]] += 1
+
+    return findings
+
+def verify_elements(findings):
+    # No finding other than Informational & Optimization
+    for g in findings:
+        if findings[g] and g not in ["Optimization", "Informational"]:
             return False
     return True
 
-def revise():
-    with open('output/data.json') as f:
-        data = json.load(f)
+def newStats():
+    stats = {}
+    stats['compilation'] = {}
+    stats['zeroVulnerability'] = 0
+    stats['vulnerability'] = {}
+    stats['vulnerability']['Low'] = 0
+    stats['vulnerability']['Medium'] = 0
+    stats['vulnerability']['High'] = 0
+    stats['vulnerability']['Informational'] = 0
+    stats['vulnerability']['Optimization'] = 0
+    stats['perfectTests'] = 0
+    stats['totalRatio'] = 0
+    stats['PerfectContract'] = 0
+
+    return stats
+
+def wilsonInterval(successes, n, z=1.96):
+    # 95% confidence interval of a success rate, still meaningful at 0% & 100%
+    if n == 0:
+        return None
+
+    p = successes / n
+    center = (p + z*z/(2*n)) / (1 + z*z/n)
+    half = z * math.sqrt(p*(1 - p)/n + z*z/(4*n*n)) / (1 + z*z/n)
+
+    return [max(0, center - half), min(1, center + half)]
+
+def percentInterval(successes, n):
+    interval = wilsonInterval(successes, n)
+
+    return [bound*100 for bound in interval] if interval is not None else None
+
+def finalizeStats(stats, compiled, notCompiled):
+    stats["compilation"]['ok'] = compiled
+    stats["compilation"]['ko'] = notCompiled
+
+    if (compiled + notCompiled == 0):
+        stats["compilation"]['ratio'] = 0
+    else:
+        stats["compilation"]['ratio'] = compiled/(compiled + notCompiled)*100
+
+    # 95% intervals of the ratios, the tests & vulnerabilities ones among the compiled contracts
+    stats["compilation"]['interval'] = percentInterval(compiled, compiled + notCompiled)
+    stats['zeroVulnerabilityInterval'] = percentInterval(stats['zeroVulnerability'], compiled)
+    stats['perfectTestsInterval'] = percentInterval(stats['perfectTests'], compiled)
+
+    if (compiled != 0):
+        stats['totalRatio'] /= compiled
+
+def itemMetrics(result):
+    # Scores of one output, stored next to it & aggregated by revise()
+    metrics = {}
+    metrics['compiled'] = result["response"]!="error" and result["compilation"]['returnCode'] == 0
+
+    if not metrics['compiled']:
+        return metrics
+
+    findings = slitherFindings(result["slither"])
+
+    metrics['vulnerability'] = dict(findings)
+    metrics['zeroVulnerability'] = verify_elements(findings)
+    metrics['perfectTests'] = result["testing"]['returnCode'] == 0
+
+    texte = result["testing"]['stdout']
+    passing_match = re.search(r'(\d+) passing', texte)
+    failing_match = re.search(r'(\d+) failing', texte)
+
+    metrics['passing'] = int(passing_match.group(1)) if passing_match else 0
+    metrics['failing'] = int(failing_match.group(1)) if failing_match else 0
+
+    total_tests = metrics['passing'] + metrics['failing']
+
+    if total_tests > 0:
+        metrics['ratio'] = metrics['passing'] / total_tests
+    else:
+        metrics['ratio'] = 0
+
+    metrics['PerfectContract'] = metrics['ratio'] == 1 and metrics['perfectTests'] and metrics['zeroVulnerability']
+
+    return metrics
+
+def metricsVersion():
+    # Changes with the scoring rules, the stored metrics computed with other rules are recomputed
+    rules = json.dumps(gravity) + detectorPattern.pattern
+    for function in [itemMetrics, slitherFindings, verify_elements]:
+        rules += inspect.getsource(function)
+
+    return hashlib.sha256(rules.encode()).hexdigest()[:16]
+
+def scoreModel(db, model):
+    # Metrics of the items of one model that are missing or outdated
+    version = metricsVersion()
+    rows = []
+
+    for m, p, it, result in iterResults(db, ["slither.stdout", "slither.stderr", "testing.stdout"], model=model, staleMetrics=version):
+        rows.append((m, p, it, itemMetrics(result)))
+
+    return rows
+
+def computeMetrics(model, path=storePath):
+    # scoreModel run in the process pool
+    db = openStore(path)
+    rows = scoreModel(db, model)
+    db.close()
+
+    return rows
+
+def updateMetrics(db, path=storePath):
+    # path None: store opened in memory, scored in this process
+    version = metricsVersion()
+    models = storedModels(db)
+    updated = 0
+
+    if path is not None and len(models) > 1 and analyzeWorkers > 1:
+        with ProcessPoolExecutor(max_workers=min(analyzeWorkers, len(models))) as executor:
+            for rows in executor.map(computeMetrics, models, [path]*len(models)):
+                writeMetrics(db, rows, version)
+                updated += len(rows)
+    else:
+        for m in models:
+            rows = scoreModel(db, m)
+            writeMetrics(db, rows, version)
+            updated += len(rows)
+
+    return updated
+
+def revise(path=storePath):
+    # The metrics of the new or changed outputs are computed first, the stats are then a reduction
+    # of the stored metrics. path may be an output archive, its store is then read in memory and the
+    # stats are written next to the archive.
+    if isArchive(path):
+        db = openStore(data=readMember(path, storePath))
+        print("analyze: " + str(updateMetrics(db, None)) + " outputs scored")
+    else:
+        db = openStore(path)
+        print("analyze: " + str(updateMetrics(db, path)) + " outputs scored")
 
     stats = {}
+    compilation = {}
 
-    for m in data:
-        stats[m] = {}
-        stats[m]['compilation'] = {}
-        stats[m]['zeroVulnerability'] = 0
-        stats[m]['vulnerability'] = {}
-        stats[m]['vulnerability']['Low'] = 0
-        stats[m]['vulnerability']['Medium'] = 0
-        stats[m]['vulnerability']['High'] = 0
-        stats[m]['vulnerability']['Informational'] = 0
-        stats[m]['vulnerability']['Optimization'] = 0
-        stats[m]['perfectTests'] = 0
-        stats[m]['totalRatio'] = 0
-        stats[m]['PerfectContract'] = 0
-        stats[m]['details'] = {}
-        
-        compiledTotal = 0
-        notCompiledTotal = 0
-
-        for p in data[m]:
-            compiled = 0
-            notCompiled = 0
-
-            stats[m]['details'][p] = {}
-            stats[m]['details'][p]["compilation"] = {}
-            stats[m]['details'][p]["zeroVulnerability"] = 0
-            stats[m]['details'][p]['vulnerability'] = {}
-            stats[m]['details'][p]['vulnerability']['Low'] = 0
-            stats[m]['details'][p]['vulnerability']['Medium'] = 0
-            stats[m]['details'][p]['vulnerability']['High'] = 0
-            stats[m]['details'][p]['vulnerability']['Informational'] = 0
-            stats[m]['details'][p]['vulnerability']['Optimization'] = 0
-            stats[m]['details'][p]['perfectTests']= 0
-            stats[m]['details'][p]['totalRatio'] = 0
-            stats[m]['details'][p]['PerfectContract'] = 0
-            
-            for it in data[m][p]:
-                if (data[m][p][it]["response"]!="error" and data[m][p][it]["compilation"]['returnCode'] == 0):
-                    compiledTotal += 1
-                    compiled += 1
-                    
-                    temp = []
-                    for d in gravity:
-                        if (data[m][p][it]["slither"]['stderr'].lower().count(("https://github.com/crytic/slither/wiki/Detector-Documentation#" + d).lower())):
-                            temp.append(d)
-
-                        stats[m]['vulnerability'][gravity[d]] = stats[m]['vulnerability'][gravity[d]] + data[m][p][it]["slither"]['stderr'].lower().count(("https://github.com/crytic/slither/wiki/Detector-Documentation#" + d).lower())
-                        stats[m]['details'][p]['vulnerability'][gravity[d]] = stats[m]['details'][p]['vulnerability'][gravity[d]] + data[m][p][it]["slither"]['stderr'].lower().count(("https://github.com/crytic/slither/wiki/Detector-Documentation#" + d).lower())
-                    
-                    if (verify_elements(gravity, temp)):
-                        stats[m]['zeroVulnerability'] += 1
-                        stats[m]['details'][p]["zeroVulnerability"] += 1
-                    
-                    if (data[m][p][it]["testing"]['returnCode'] == 0):
-                        stats[m]['perfectTests'] += 1
-                        stats[m]['details'][p]['perfectTests'] += 1
-                    
-                    texte = data[m][p][it]["testing"]['stdout']
-                    passing_match = re.search(r'(\d+) passing', texte)
-                    failing_match = re.search(r'(\d+) failing', texte)
-
-                    passing = int(passing_match.group(1)) if passing_match else 0
-                    failing = int(failing_match.group(1)) if failing_match else 0
-
-                    total_tests = passing + failing
-
-                    if total_tests > 0:
-                        ratio = passing / total_tests
-                    else:
-                        ratio = 0
-                    
-                    if (ratio == 1 and data[m][p][it]["testing"]['returnCode'] == 0 and verify_elements(gravity, temp)):
-                        stats[m]['PerfectContract'] += 1 
-                        stats[m]['details'][p]['PerfectContract'] += 1 
-                    
-                    stats[m]['totalRatio'] += (ratio*100)
-                    stats[m]['details'][p]['totalRatio'] += (ratio*100)
-                
-                else :
-                    notCompiledTotal += 1
-                    notCompiled += 1
-                    
-            stats[m]['details'][p]["compilation"]['ok'] = compiled
-            stats[m]['details'][p]["compilation"]['ko'] = notCompiled
-
-            if (compile == 0):
-                stats[m]['details'][p]["compilation"]['ratio'] = 0
-            else:
-                stats[m]['details'][p]["compilation"]['ratio'] = compiled/(compiled + notCompiled)*100
-            
-            if (compiled != 0):
-                stats[m]['details'][p]['totalRatio'] /= compiled
-                
-        stats[m]['compilation']['ok'] = compiledTotal
-        stats[m]['compilation']['ko'] = notCompiledTotal
-        stats[m]['compilation']['ratio'] = stats[m]['compilation']['ok']/(compiledTotal + notCompiledTotal)*100
+    for m, p, it, metrics in iterMetrics(db):
+        if m not in stats:
+            stats[m] = newStats()
+            stats[m]['details'] = {}
+            compilation[m] = {}
+
+        if p not in stats[m]['details']:
+            stats[m]['details'][p] = newStats()
+            compilation[m][p] = [0, 0]
+
+        if metrics['compiled']:
+            compilation[m][p][0] += 1
+
+            for g in metrics['vulnerability']:
+                if g in stats[m]['vulnerability']:
+                    stats[m]['vulnerability'][g] += metrics['vulnerability'][g]
+                    stats[m]['details'][p]['vulnerability'][g] += metrics['vulnerability'][g]
+
+            for key in ['zeroVulnerability', 'perfectTests', 'PerfectContract']:
+                if metrics[key]:
+                    stats[m][key] += 1
+                    stats[m]['details'][p][key] += 1
+
+            stats[m]['totalRatio'] += (metrics['ratio']*100)
+            stats[m]['details'][p]['totalRatio'] += (metrics['ratio']*100)
         
-        if (compiledTotal != 0):
-            stats[m]['totalRatio'] /= compiledTotal
+        else :
+            compilation[m][p][1] += 1
+
+    db.close()
+
+    for m in stats:
+        for p in stats[m]['details']:
+            finalizeStats(stats[m]['details'][p], compilation[m][p][0], compilation[m][p][1])
+
+        finalizeStats(stats[m], sum(c[0] for c in compilation[m].values()), sum(c[1] for c in compilation[m].values()))
                 
-    with open("output/stats.json", "w") as fichier:
+    with open(os.path.join(os.path.dirname(path), "stats.json"), "w") as fichier:
         json.dump(stats, fichier, indent = 4)
 
 if __name__ == '__main__':
-    revise()
+    # python3 analyze.py output_pipeline.tar.gz : stats of an archived run
+    revise(sys.argv[1] if len(sys.argv) > 1 else storePath)
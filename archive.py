@@ -0,0 +1,140 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+import glob
+import gzip
+import hashlib
+import io
+import os
+import tarfile
+import time
+
+from store import storePath
+
+# Archive of the outputs, written as the items complete instead of zipping output/ at the end: a tar
+# stream compressed on the fly, the files of identical content (e.g. the same contract generated again)
+# stored once, as hard links to the first copy. The store & the stats, written last, are added when
+# the archive is closed. It is written to a temporary file, an interrupted run keeps the previous one
+# and its outputs are archived again by the resumed run, see compute().
+archivePath = "output_pipeline.tar.gz"
+compressLevel = 6        # gzip level, 9 compresses a few % more for twice the time
+closingFiles = [storePath, os.path.join("output", "stats.json")]
+
+def isArchive(path):
+    return path.endswith(".tar.gz")
+
+class Archive:
+    def __init__(self, path=archivePath, resume=False):
+        self.path = path
+        self.tmp = path + "." + str(os.getpid()) + ".tmp"
+
+        # Left by a run that was killed
+        for tmp in glob.glob(glob.escape(path) + ".*.tmp"):
+            os.remove(tmp)
+
+        self.gzip = gzip.GzipFile(self.tmp, "wb", compresslevel=compressLevel)
+        self.tar = tarfile.open(fileobj=self.gzip, mode="w|")
+
+        self.contents = {}  # sha256 of a content -> member holding it
+        self.members = {}   # member -> sha256 of its content
+        self.removals = []  # files removed once the archive is in place
+        self.files = 0
+        self.links = 0
+
+        # A resumed run carries the files of the previous archive over
+        if resume and os.path.exists(path):
+            self.copy(path)
+
+    def copy(self, path):
+        with tarfile.open(path, "r|gz") as previous:
+            for member in previous:
+                if member.name in closingFiles:
+                    continue
+
+                if member.islnk() and member.linkname in self.members:
+                    self.link(member.name, self.members[member.linkname])
+                elif member.isfile():
+                    self.addBytes(member.name, previous.extractfile(member).read())
+
+    def link(self, name, h):
+        info = tarfile.TarInfo(name)
+        info.type = tarfile.LNKTYPE
+        info.linkname = self.contents[h]
+        info.mtime = int(time.time())
+
+        self.tar.addfile(info)
+        self.members[name] = h
+        self.links += 1
+
+    def addBytes(self, name, data):
+        h = hashlib.sha256(data).hexdigest()
+
+        if self.members.get(name) == h:
+            return
+
+        # A member written again no longer holds its former content for the next links
+        if name in self.members and self.contents.get(self.members[name]) == name:
+            del self.contents[self.members[name]]
+
+        if h in self.contents:
+            self.link(name, h)
+            return
+
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+
+        self.tar.addfile(info, io.BytesIO(data))
+        self.contents[h] = name
+        self.members[name] = h
+        self.files += 1
+
+    def add(self, path, remove=False):
+        # Adds the file under its relative path, a missing file is skipped. With remove, the file is
+        # removed when the archive is closed.
+        if not os.path.exists(path):
+            return
+
+        with open(path, "rb") as file:
+            self.addBytes(os.path.normpath(path), file.read())
+
+        if remove:
+            self.removals.append(path)
+
+    def close(self):
+        for path in closingFiles:
+            self.add(path)
+
+        self.tar.close()
+        self.gzip.close()
+        os.replace(self.tmp, self.path)
+
+        for path in self.removals:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def abort(self):
+        # The run failed, the previous archive is left in place
+        self.tar.close()
+        self.gzip.close()
+        os.remove(self.tmp)
+
+    def report(self):
+        return str(self.files + self.links) + " files, " + str(self.links) + " of them stored once already"
+
+def readMember(path, name):
+    # Content of the file name of the archive, read without extracting the archive
+    with tarfile.open(path, "r:gz") as tar:
+        return tar.extractfile(tar.getmember(os.path.normpath(name))).read()
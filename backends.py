@@ -0,0 +1,161 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+import threading
+import time
+
+maxCooldown = 60  # seconds a failing backend is set aside at most
+
+class Backend:
+    # An Ollama host: the models it holds (None for all of them), its parallel slots
+    # (OLLAMA_NUM_PARALLEL) and the number of models it keeps loaded at once (OLLAMA_MAX_LOADED_MODELS)
+    def __init__(self, url, models=None, maxRequests=1, maxModels=1):
+        self.url = url.rstrip("/")
+        self.models = models
+        self.maxRequests = maxRequests
+        self.maxModels = maxModels
+
+        self.inFlight = 0
+        self.running = {}  # requests in flight per model
+        self.loaded = []   # models last run, the ones Ollama most likely keeps loaded
+        self.failures = 0  # consecutive failures
+        self.downUntil = 0
+
+        self.requests = 0
+        self.errors = 0
+        self.loads = 0
+        self.preloads = 0
+
+    def holds(self, model):
+        return self.models is None or model in self.models
+
+    def generateUrl(self):
+        return self.url + "/api/generate"
+
+    def report(self):
+        return (self.url + ": " + str(self.requests) + " requests (" + str(self.errors) + " errors), "
+                + str(self.loads) + " model loads (" + str(self.preloads) + " preloaded)")
+
+class Scheduler:
+    # Routes the generation requests to the backends. A backend takes a request for a model it holds
+    # when it has a free slot and either runs this model already or has room for one more model, so
+    # a host never swaps models under requests in flight. Among them, the backends running the model
+    # come first, then the ones that ran it last, then the least busy. A backend failing maxFailures
+    # times in a row is set aside for cooldown seconds, longer after each new failure.
+    def __init__(self, backends, cooldown=5.0, maxFailures=3):
+        self.backends = backends
+        self.cooldown = cooldown
+        self.maxFailures = maxFailures
+        self.lock = threading.Lock()
+
+    def missing(self, models):
+        # Models held by no backend, their requests would wait forever
+        return [m for m in models if not any(backend.holds(m) for backend in self.backends)]
+
+    def slots(self):
+        return sum(backend.maxRequests for backend in self.backends)
+
+    def load(self, backend, model):
+        if model not in backend.loaded:
+            backend.loads += 1
+        else:
+            backend.loaded.remove(model)
+
+        backend.loaded = ([model] + backend.loaded)[:backend.maxModels]
+
+    def acquire(self, model, exclude=(), loadedOnly=False):
+        # Backend reserved for a request of model, None if none can take it now. The backends in
+        # exclude are skipped, unless no other backend holding the model is up. With loadedOnly,
+        # only the backends running the model or having it loaded are considered.
+        now = time.time()
+
+        if not any(backend.holds(model) and backend not in exclude and now >= backend.downUntil for backend in self.backends):
+            exclude = ()
+
+        best = None
+        bestScore = None
+
+        with self.lock:
+            for backend in self.backends:
+                if not backend.holds(model) or backend in exclude or now < backend.downUntil or backend.inFlight >= backend.maxRequests:
+                    continue
+
+                if model not in backend.running and len(backend.running) >= backend.maxModels:
+                    continue
+
+                if loadedOnly and model not in backend.running and model not in backend.loaded:
+                    continue
+
+                score = (model in backend.running, model in backend.loaded, -backend.inFlight)
+
+                if best is None or score > bestScore:
+                    best = backend
+                    bestScore = score
+
+            if best is not None:
+                self.load(best, model)
+                best.running[model] = best.running.get(model, 0) + 1
+                best.inFlight += 1
+                best.requests += 1
+
+        return best
+
+    def preload(self, model):
+        # Backend with room to load model next to the models it runs, None if none has. The model
+        # is then counted as loaded there.
+        now = time.time()
+        best = None
+
+        with self.lock:
+            if any(model in backend.running or model in backend.loaded for backend in self.backends if now >= backend.downUntil):
+                return None
+
+            for backend in self.backends:
+                if not backend.holds(model) or now < backend.downUntil or len(backend.running) >= backend.maxModels:
+                    continue
+
+                if best is None or backend.inFlight < best.inFlight:
+                    best = backend
+
+            if best is not None:
+                self.load(best, model)
+                best.preloads += 1
+
+        return best
+
+    def release(self, backend, model, failed=False, unreachable=False):
+        # An unreachable backend is set aside at once
+        with self.lock:
+            backend.running[model] -= 1
+            if backend.running[model] == 0:
+                del backend.running[model]
+
+            backend.inFlight -= 1
+
+            if failed:
+                backend.errors += 1
+                backend.failures = max(backend.failures + 1, self.maxFailures if unreachable else 0)
+
+                if backend.failures >= self.maxFailures:
+                    backend.downUntil = time.time() + min(maxCooldown, self.cooldown * (backend.failures - self.maxFailures + 1))
+            else:
+                backend.failures = 0
+
+    def nextRecovery(self):
+        # Seconds until a backend set aside can be used again, None if none is
+        now = time.time()
+
+        with self.lock:
+            waits = [backend.downUntil - now for backend in self.backends if backend.downUntil > now]
+
+        return min(waits) if waits else None
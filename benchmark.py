@@ -0,0 +1,345 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+# Benchmark of the pipeline itself: compute() & revise() run over the datasets against a local
+# stand-in of the Ollama API replaying canned responses, the items/s, the latency percentiles of
+# the stages and the peak memory are reported and compared with a previous report.
+
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dataset import loadDataset
+from store import openStore, iterResults
+
+benchDatasets = ["simple_dataset.csv", "intermediate_dataset.csv", "complex_dataset.csv"]
+benchModels = ["llama3", "codellama"]
+benchIterations = 2
+
+mockPort = 11435
+firstTokenLatency = 0.5  # seconds before the first token of a response
+tokenLatency = 0.01      # seconds between two tokens
+errorRate = 0.0          # share of the requests answered by an HTTP 500
+tolerance = 0.2          # items/s drop below the baseline reported as a regression
+
+percentiles = [50, 90, 99]
+
+def promptNames(datasets):
+    # {prompt text: prompt name}, the mock only receives the text
+    return {prompt["prompt"]: prompt["name"] for prompt in loadDataset(datasets)[0]}
+
+def loadCorpus(path):
+    # Canned responses, one {"model", "prompt", "response"} per line, the prompt being its name
+    corpus = {}
+
+    if path is None:
+        return corpus
+
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                corpus.setdefault((entry["model"], entry["prompt"]), []).append(entry["response"])
+                corpus.setdefault((None, entry["prompt"]), []).append(entry["response"])
+
+    return corpus
+
+def recordCorpus(storeFile, path):
+    # Writes the responses of a results store as a corpus
+    db = openStore(storeFile)
+    count = 0
+
+    with open(path, "w") as file:
+        for model, prompt, iteration, result in iterResults(db, ["response"]):
+            if result["response"] != "error":
+                file.write(json.dumps({"model": model, "prompt": prompt, "response": result["response"]}) + "\n")
+                count += 1
+
+    db.close()
+
+    return count
+
+def cannedResponse(corpus, names, model, prompt, count):
+    # Same response for the same (model, prompt, request number) from one run to the next
+    name = names.get(prompt, "")
+    responses = corpus.get((model, name)) or corpus.get((None, name))
+    h = int(hashlib.sha256((model + name + str(count)).encode()).hexdigest()[:8], 16)
+
+    if responses:
+        return responses[h % len(responses)], h
+
+    # Without corpus: an empty contract named after the one expected by the test
+    match = re.search(r'getContractFactory\(\s*["\'](\w+)', prompt)
+    contract = match.group(1) if match else "Contract"
+
+    return ("Here is the contract:\n```solidity\n// SPDX-License-Identifier: MIT\npragma solidity ^0.8.0;\n\ncontract " + contract
+            + " {\n}\n```\nThis contract can be extended with the functions of the tests.", h)
+
+def serveMock(port, corpusFile, datasets, firstLatency, tokenDelay, errors):
+    corpus = loadCorpus(corpusFile)
+    names = promptNames(datasets)
+    counts = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, code, body, contentType="application/json"):
+            self.send_response(code)
+            self.send_header("Content-Type", contentType)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            model = request["model"]
+
+            # Preload of the model, no prompt
+            if "prompt" not in request:
+                self.send(200, json.dumps({"model": model, "response": "", "done": True, "done_reason": "load"}).encode())
+                return
+
+            with lock:
+                counts[(model, request["prompt"])] = counts.get((model, request["prompt"]), 0) + 1
+                count = counts[(model, request["prompt"])]
+
+            text, h = cannedResponse(corpus, names, model, request["prompt"], count)
+
+            if (h % 1000) < errors * 1000:
+                self.send(500, b'{"error": "mock error"}')
+                return
+
+            tokens = re.findall(r'\S+\s*|\s+', text)
+            start = time.perf_counter_ns()
+            time.sleep(firstLatency)
+
+            last = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "response": "", "done": True,
+                    "done_reason": "stop", "context": [1], "load_duration": 0, "prompt_eval_count": len(request["prompt"]) // 4,
+                    "eval_count": len(tokens)}
+
+            if not request.get("stream", True):
+                time.sleep(tokenDelay * len(tokens))
+                last["response"] = text
+                last["total_duration"] = time.perf_counter_ns() - start
+                self.send(200, json.dumps(last).encode())
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            try:
+                for token in tokens:
+                    self.chunk({"model": model, "response": token, "done": False})
+                    time.sleep(tokenDelay)
+
+                last["total_duration"] = time.perf_counter_ns() - start
+                self.chunk(last)
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped the generation
+                self.close_connection = True
+
+        def chunk(self, message):
+            data = (json.dumps(message) + "\n").encode()
+            self.wfile.write(("%x\r\n" % len(data)).encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    class Server(ThreadingHTTPServer):
+        # The early stops of the pipeline (stopAfterCode, maxSeconds) close the connections on purpose
+        def handle_error(self, request, client_address):
+            if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+                super().handle_error(request, client_address)
+
+    Server(("127.0.0.1", port), Handler).serve_forever()
+
+def startMock(port, corpusFile, datasets, firstLatency, tokenDelay, errors):
+    process = multiprocessing.Process(target=serveMock, args=(port, corpusFile, datasets, firstLatency, tokenDelay, errors), daemon=True)
+    process.start()
+
+    # Ready once the port accepts connections
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    return process
+
+def percentile(values, p):
+    values = sorted(values)
+
+    if not values:
+        return 0
+
+    # Nearest rank
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+def measure(pipeline, analyze, datasetName):
+    start = time.perf_counter()
+    pipeline.compute(datasetName=datasetName)
+    computeTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analyze.revise()
+    reviseTime = time.perf_counter() - start
+
+    db = openStore()
+    items = 0
+    errors = 0
+    latencies = {}
+    rss = 0
+
+    for model, prompt, iteration, result in iterResults(db, []):
+        items += 1
+        errors += result["response"] == "error"
+
+        for stage, usage in result.get("usage", {}).items():
+            # The latency of a batched item is the one of its batch, not its share of the batch time
+            latencies.setdefault(stage, []).append(usage.get("latency", usage["wall"]))
+            rss = max(rss, usage["rss"] or 0)
+
+    db.close()
+
+    return {"items": items,
+            "errors": errors,
+            "computeTime": computeTime,
+            "reviseTime": reviseTime,
+            "itemsPerSecond": items / computeTime if computeTime > 0 else 0,
+            "stages": {stage: {"p" + str(p): percentile(latencies[stage], p) for p in percentiles} for stage in latencies},
+            "peakRss": rss}
+
+def runBenchmark(args):
+    root = os.path.abspath(os.path.dirname(__file__))
+    datasets = [os.path.join(root, d) for d in args.datasets]
+    corpus = args.corpus and os.path.abspath(args.corpus)
+
+    # The pipeline & the mock (which compiles the datasets) work in a scratch directory, output/, cache/
+    # & sandboxes/ of the repository are left untouched
+    workdir = tempfile.mkdtemp(prefix="benchmark_")
+    os.symlink(os.path.join(root, "hardhat_test_env"), os.path.join(workdir, "hardhat_test_env"))
+    os.chdir(workdir)
+
+    mock = startMock(args.port, corpus, datasets, args.first_token_latency, args.token_latency, args.error_rate)
+
+    import pipeline
+    import analyze
+
+    pipeline.backends = [{"url": "http://127.0.0.1:" + str(args.port), "models": None, "maxRequests": args.slots, "maxModels": 1}]
+    pipeline.models = args.models
+    pipeline.nbIteration = args.iterations
+    pipeline.useCache = not args.no_cache
+    pipeline.progressInterval = 0
+
+    report = {"models": args.models, "iterations": args.iterations, "firstTokenLatency": args.first_token_latency,
+              "tokenLatency": args.token_latency, "corpus": args.corpus, "datasets": {}}
+
+    try:
+        for dataset in datasets:
+            report["datasets"][os.path.basename(dataset)] = measure(pipeline, analyze, dataset)
+    finally:
+        mock.terminate()
+        os.chdir(root)
+
+        if not args.keep:
+            shutil.rmtree(workdir)
+
+    report["peakRss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return report
+
+def printReport(report, baseline=None):
+    regressions = []
+
+    print("\n" + "-"*70 + "\nBenchmark: " + ", ".join(report["models"]) + ", " + str(report["iterations"]) + " iterations")
+
+    for dataset, result in report["datasets"].items():
+        print(dataset + ": " + str(result["items"]) + " items (" + str(result["errors"]) + " errors), "
+              + "{:.2f}".format(result["itemsPerSecond"]) + " items/s, compute " + "{:.1f}".format(result["computeTime"]) + " s, "
+              + "revise " + "{:.2f}".format(result["reviseTime"]) + " s, peak rss of the stages " + str(result["peakRss"]//1024) + " MB")
+
+        for stage, latency in result["stages"].items():
+            print("\t" + stage + ": " + ", ".join(p + " " + "{:.3f}".format(latency[p]) + " s" for p in latency))
+
+        if baseline is not None and dataset in baseline["datasets"]:
+            reference = baseline["datasets"][dataset]["itemsPerSecond"]
+
+            print("\tbaseline: " + "{:.2f}".format(reference) + " items/s")
+
+            if result["itemsPerSecond"] < reference * (1 - tolerance):
+                regressions.append(dataset)
+
+    print("Peak rss of the pipeline: " + str(report["peakRss"]//1024) + " MB")
+
+    if regressions:
+        print("Regression: " + ", ".join(regressions) + " more than " + "{:.0f}".format(tolerance*100) + "% below the baseline")
+
+    return regressions
+
+def parseArguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datasets", nargs="+", default=benchDatasets, help="CSV files of the prompts")
+    parser.add_argument("--models", nargs="+", default=benchModels, help="names of the mocked models")
+    parser.add_argument("--iterations", type=int, default=benchIterations, help="iterations per model & prompt")
+    parser.add_argument("--corpus", help="JSON lines of canned responses {model, prompt, response}, empty contracts if missing")
+    parser.add_argument("--record", nargs=2, metavar=("STORE", "CORPUS"), help="write the responses of a results store as a corpus and exit")
+    parser.add_argument("--port", type=int, default=mockPort, help="port of the mock Ollama server")
+    parser.add_argument("--first-token-latency", type=float, default=firstTokenLatency, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=tokenLatency, help="seconds between two tokens")
+    parser.add_argument("--slots", type=int, default=4, help="parallel requests of the mock Ollama server")
+    parser.add_argument("--error-rate", type=float, default=errorRate, help="share of the requests failing")
+    parser.add_argument("--no-cache", action="store_true", help="disable the cache of the tools outputs")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory of the runs")
+    parser.add_argument("--output", default="benchmark.json", help="report written at the end")
+    parser.add_argument("--baseline", help="previous report, exits with 1 when the items/s dropped")
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parseArguments()
+
+    if args.record:
+        print(str(recordCorpus(*args.record)) + " responses written in " + args.record[1])
+        sys.exit(0)
+
+    output = os.path.abspath(args.output)
+    baseline = None
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    report = runBenchmark(args)
+
+    with open(output, "w") as file:
+        json.dump(report, file, indent=4)
+
+    sys.exit(1 if printReport(report, baseline) else 0)
@@ -0,0 +1,154 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+import hashlib
+import json
+import os
+import subprocess
+import threading
+
+# The cache lives outside of output/ so that it survives cleanRepo()
+cacheDir = "cache"
+cacheMaxSize = 2 * 1024**3  # bytes, the least recently used entries are evicted above
+
+toolchain = None
+lock = threading.Lock()
+hits = {}
+misses = {}
+
+def commandVersion(command):
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+        return result.stdout.strip() + result.stderr.strip()
+    except OSError:
+        return "unavailable"
+
+def hardhatVersion(testEnv="hardhat_test_env"):
+    version = ""
+
+    for f in ["node_modules/hardhat/package.json", "package.json"]:
+        if os.path.exists(os.path.join(testEnv, f)):
+            with open(os.path.join(testEnv, f)) as file:
+                version += json.dumps(json.load(file).get("version"))
+
+    # The solc version used by Hardhat is set in its config
+    if os.path.exists(os.path.join(testEnv, "hardhat.config.js")):
+        with open(os.path.join(testEnv, "hardhat.config.js")) as file:
+            version += file.read()
+
+    return version
+
+def toolchainVersions():
+    global toolchain
+
+    with lock:
+        if toolchain is None:
+            solc = commandVersion(["solc", "--version"])
+
+            toolchain = {
+                "compilation": solc,
+                "slither": solc + commandVersion(["slither", "--version"]),
+                # The tests can run on the artifacts of the pipeline solc, see testArtifacts
+                "testing": solc + hardhatVersion() + commandVersion(["node", "--version"])
+            }
+
+    return toolchain
+
+def cacheKey(step, inputs):
+    # Hash of the step, the versions of the tools it runs and the content of its inputs
+    h = hashlib.sha256()
+    h.update(step.encode())
+    h.update(toolchainVersions()[step].encode())
+
+    for content in inputs:
+        h.update(hashlib.sha256(content).digest())
+
+    return h.hexdigest()
+
+def cachePath(key):
+    return os.path.join(cacheDir, key[:2], key + ".json")
+
+def getCache(step, key):
+    path = cachePath(key)
+
+    try:
+        with open(path) as file:
+            value = json.load(file)
+    except (OSError, ValueError):
+        with lock:
+            misses[step] = misses.get(step, 0) + 1
+        return None
+
+    # The modification time orders the entries for the eviction
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    with lock:
+        hits[step] = hits.get(step, 0) + 1
+
+    return value
+
+def putCache(key, value):
+    path = cachePath(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # The cache can be shared by several pipelines, see shard.py
+    tmp = path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+    with open(tmp, "w") as file:
+        json.dump(value, file)
+    os.replace(tmp, path)
+
+def evictCache():
+    if not os.path.exists(cacheDir):
+        return 0
+
+    entries = []
+    size = 0
+
+    for root, dirs, files in os.walk(cacheDir):
+        # Only the entries are evicted (cachePath), not the compiled datasets of dataset.py
+        if root == cacheDir:
+            dirs[:] = [d for d in dirs if len(d) == 2]
+            continue
+
+        for f in files:
+            try:
+                stat = os.stat(os.path.join(root, f))
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(root, f)))
+            size += stat.st_size
+
+    entries.sort()
+    evicted = 0
+
+    for mtime, fileSize, path in entries:
+        if size <= cacheMaxSize:
+            break
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+        size -= fileSize
+        evicted += 1
+
+    return evicted
+
+def cacheReport():
+    return ", ".join(step + " " + str(hits.get(step, 0)) + "/" + str(hits.get(step, 0) + misses.get(step, 0)) + " hits"
+                     for step in sorted(set(hits) | set(misses)))
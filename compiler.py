@@ -0,0 +1,199 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+from usage import runCommand
+
+# Outputs asked to solc for every contract: what Slither and Hardhat need to skip their own compilation
+outputSelection = {
+    "*": {
+        "*": ["abi",
+              "evm.bytecode.object", "evm.bytecode.sourceMap", "evm.bytecode.linkReferences",
+              "evm.deployedBytecode.object", "evm.deployedBytecode.sourceMap", "evm.deployedBytecode.linkReferences",
+              "evm.gasEstimates", "userdoc", "devdoc"],
+        "": ["ast"]
+    }
+}
+
+solcVersion = None
+lock = threading.Lock()
+
+def compilerVersion():
+    global solcVersion
+
+    with lock:
+        if solcVersion is None:
+            result = subprocess.run(["solc", "--version"], capture_output=True, text=True)
+            match = re.search(r'Version: (\d+\.\d+\.\d+)', result.stdout)
+            solcVersion = match.group(1) if match else "unknown"
+
+    return solcVersion
+
+def sourceKey(content):
+    # Name of a contract in a batch, identical contracts are compiled once
+    return hashlib.sha256(content).hexdigest() + ".sol"
+
+def runSolc(sources):
+    standardInput = {
+        "language": "Solidity",
+        "sources": {key: {"content": sources[key]} for key in sources},
+        "settings": {"outputSelection": outputSelection}
+    }
+
+    result = runCommand(["solc", "--standard-json"], input=json.dumps(standardInput))
+
+    try:
+        return json.loads(result.stdout)
+    except ValueError:
+        raise RuntimeError("solc --standard-json failed: " + result.stderr)
+
+def sourceOutput(key, standardOutput, diagnostics, failed):
+    # Output of one contract of the batch: return code, bytecode & gas estimates, diagnostics & artifacts
+    stdout = ""
+    contracts = standardOutput.get("contracts", {}).get(key, {}) if not failed else {}
+
+    for name in contracts:
+        stdout += "\n======= " + key + ":" + name + " =======\n"
+        stdout += "Gas estimation:\n" + json.dumps(contracts[name]["evm"].get("gasEstimates")) + "\n"
+        stdout += "Binary:\n" + contracts[name]["evm"]["bytecode"]["object"] + "\n"
+
+    artifacts = None
+    if not failed:
+        artifacts = {"version": compilerVersion(),
+                     "sourceKey": key,
+                     "ast": standardOutput.get("sources", {}).get(key, {}).get("ast"),
+                     "contracts": contracts}
+
+    return {"returnCode": 1 if failed else 0,
+            "stdout": stdout,
+            "stderr": "\n".join(e["formattedMessage"] for e in diagnostics),
+            "artifacts": artifacts}
+
+def compileSources(sources):
+    # Compiles the sources {key: text} in one solc --standard-json run. solc does not generate any
+    # bytecode when a source has an error, the sources in error are set aside and the others compiled
+    # again. Returns {key: output}.
+    outputs = {}
+    pending = dict(sources)
+
+    while pending:
+        standardOutput = runSolc(pending)
+        errors = standardOutput.get("errors", [])
+
+        diagnostics = {key: [] for key in pending}
+        unattributed = []
+
+        for e in errors:
+            key = e.get("sourceLocation", {}).get("file")
+
+            if key in diagnostics:
+                diagnostics[key].append(e)
+            else:
+                unattributed.append(e)
+
+        failed = [key for key in pending if any(e["severity"] == "error" for e in diagnostics[key])]
+
+        if any(e["severity"] == "error" for e in unattributed) and not failed:
+            # Errors without location: each source is compiled on its own to know which one fails
+            if len(pending) > 1:
+                for key in pending:
+                    outputs.update(compileSources({key: pending[key]}))
+                break
+
+            failed = list(pending)
+
+        for key in failed:
+            outputs[key] = sourceOutput(key, standardOutput, diagnostics[key] + (unattributed if len(pending) == 1 else []), True)
+
+        if failed:
+            pending = {key: pending[key] for key in pending if key not in failed}
+            continue
+
+        for key in pending:
+            outputs[key] = sourceOutput(key, standardOutput, diagnostics[key], False)
+
+        break
+
+    return outputs
+
+def writeSlitherExport(path, artifacts, source):
+    # crytic-compile "standard" export of a compiled contract, Slither loads it without compiling again.
+    # source is the .sol file of the item, read by Slither for the source mappings.
+    key = artifacts["sourceKey"]
+    filename = {"absolute": os.path.abspath(source), "used": key, "short": key, "relative": source}
+    contracts = {}
+
+    for name in artifacts["contracts"]:
+        contract = artifacts["contracts"][name]
+        contracts[name] = {
+            "abi": contract["abi"],
+            "bin": contract["evm"]["bytecode"]["object"],
+            "bin-runtime": contract["evm"]["deployedBytecode"]["object"],
+            "srcmap": contract["evm"]["bytecode"]["sourceMap"],
+            "srcmap-runtime": contract["evm"]["deployedBytecode"]["sourceMap"],
+            "filenames": filename,
+            "libraries": {},
+            "is_dependency": False,
+            "userdoc": contract.get("userdoc", {}),
+            "devdoc": contract.get("devdoc", {})
+        }
+
+    export = {
+        "compilation_units": {
+            key: {
+                "compiler": {"compiler": "solc", "version": artifacts["version"], "optimized": False},
+                "source_units": {source: {"ast": artifacts["ast"], "contracts": contracts}},
+                "filenames": [filename]
+            }
+        },
+        "package": None,
+        "working_dir": os.getcwd(),
+        "type": 1,
+        "unit_tests": [],
+        "crytic_version": "0.0.2"
+    }
+
+    with open(path, "w") as file:
+        json.dump(export, file)
+
+def writeHardhatArtifacts(sandbox, artifacts):
+    # Hardhat artifacts of contracts/contract.sol, used by hardhat test --no-compile
+    for directory in ["artifacts", "cache"]:
+        if os.path.exists(os.path.join(sandbox, directory)):
+            shutil.rmtree(os.path.join(sandbox, directory))
+
+    directory = os.path.join(sandbox, "artifacts", "contracts", "contract.sol")
+    os.makedirs(directory)
+
+    for name in artifacts["contracts"]:
+        contract = artifacts["contracts"][name]
+        artifact = {
+            "_format": "hh-sol-artifact-1",
+            "contractName": name,
+            "sourceName": "contracts/contract.sol",
+            "abi": contract["abi"],
+            "bytecode": "0x" + contract["evm"]["bytecode"]["object"],
+            "deployedBytecode": "0x" + contract["evm"]["deployedBytecode"]["object"],
+            "linkReferences": contract["evm"]["bytecode"].get("linkReferences", {}),
+            "deployedLinkReferences": contract["evm"]["deployedBytecode"].get("linkReferences", {})
+        }
+
+        with open(os.path.join(directory, name + ".json"), "w") as file:
+            json.dump(artifact, file, indent=2)
@@ -0,0 +1,151 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+import hashlib
+import json
+import os
+import re
+
+import pandas as pd
+
+from cache import cacheDir
+
+# Every CSV dataset is compiled once into a JSON file holding its prompts, their extracted tests,
+# hashes & tags. The compiled file is used as long as the CSV is unchanged, the eviction of the
+# cache leaves it alone.
+compiledDir = os.path.join(cacheDir, "datasets")
+testsDir = os.path.join("output", "extracted_tests")
+formatVersion = 1
+
+testPattern = re.compile(r"```js(.*?)```", re.DOTALL)
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def compiledPath(csvPath):
+    return os.path.join(compiledDir, os.path.splitext(os.path.basename(csvPath))[0] + ".json")
+
+def compileDataset(csvPath, content):
+    # One record per prompt: name, text, extracted test, hashes & tags. The tags are the name of the
+    # dataset without "_dataset" and the ones of an optional Tags column (comma separated).
+    df = pd.read_csv(csvPath, sep=";", encoding='latin1')
+    datasetTag = os.path.splitext(os.path.basename(csvPath))[0].replace("_dataset", "")
+    prompts = []
+
+    for i in range(df.shape[0]):
+        name = str(df.iat[i, 0])
+        text = str(df.iat[i, 1])
+        tests = testPattern.findall(text)
+        test = tests[0] if tests else None
+        tags = [datasetTag]
+
+        if "Tags" in df.columns and isinstance(df["Tags"].iat[i], str):
+            tags += [t.strip() for t in df["Tags"].iat[i].split(",") if t.strip()]
+
+        prompts.append({"name": name,
+                        "prompt": text,
+                        "test": test,
+                        "promptHash": sha256(text.encode()),
+                        "testHash": sha256(test.encode()) if test is not None else None,
+                        "tags": tags,
+                        "dataset": os.path.basename(csvPath)})
+
+    return {"format": formatVersion, "source": {"sha256": sha256(content)}, "prompts": prompts}
+
+def loadCompiled(csvPath):
+    # Compiled dataset of csvPath, rebuilt when the CSV changed. The size & modification time of
+    # the CSV are checked first, its content is hashed only when they changed.
+    stat = os.stat(csvPath)
+    path = compiledPath(csvPath)
+    compiled = None
+
+    try:
+        with open(path) as file:
+            compiled = json.load(file)
+    except (OSError, ValueError):
+        pass
+
+    if compiled is not None and compiled.get("format") == formatVersion:
+        if compiled["source"].get("size") == stat.st_size and compiled["source"].get("mtime") == stat.st_mtime_ns:
+            return compiled, False
+
+    with open(csvPath, "rb") as file:
+        content = file.read()
+
+    rebuilt = compiled is None or compiled.get("format") != formatVersion or compiled["source"]["sha256"] != sha256(content)
+
+    if rebuilt:
+        compiled = compileDataset(csvPath, content)
+
+    compiled["source"]["size"] = stat.st_size
+    compiled["source"]["mtime"] = stat.st_mtime_ns
+
+    os.makedirs(compiledDir, exist_ok=True)
+    tmp = path + "." + str(os.getpid()) + ".tmp"
+    with open(tmp, "w") as file:
+        json.dump(compiled, file)
+    os.replace(tmp, path)
+
+    return compiled, rebuilt
+
+def loadDataset(csvPaths, names=None, tags=None):
+    # Prompts of the datasets merged in order, restricted to the given names and/or tags. Returns the
+    # prompts & {csv path: rebuilt}.
+    prompts = []
+    seen = {}
+    rebuilt = {}
+
+    for csvPath in csvPaths:
+        compiled, rebuilt[csvPath] = loadCompiled(csvPath)
+
+        for prompt in compiled["prompts"]:
+            if prompt["name"] in seen:
+                if seen[prompt["name"]]["promptHash"] != prompt["promptHash"]:
+                    raise ValueError("prompt " + prompt["name"] + " differs in " + seen[prompt["name"]]["dataset"] + " and " + prompt["dataset"])
+                continue
+
+            seen[prompt["name"]] = prompt
+            prompts.append(prompt)
+
+    if names:
+        unknown = set(names) - set(seen)
+        if unknown:
+            raise ValueError("unknown prompts " + str(sorted(unknown)))
+
+        prompts = [p for p in prompts if p["name"] in names]
+
+    if tags:
+        prompts = [p for p in prompts if set(tags) & set(p["tags"])]
+
+    return prompts, rebuilt
+
+def testPath(name):
+    return os.path.join(testsDir, name + ".js")
+
+def writeTests(prompts):
+    # Writes the extracted tests, a test file with the same content is left untouched
+    os.makedirs(testsDir, exist_ok=True)
+
+    for prompt in prompts:
+        path = testPath(prompt["name"])
+
+        if prompt["test"] is None:
+            continue
+
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                if sha256(file.read()) == prompt["testHash"]:
+                    continue
+
+        with open(path, "wb") as file:
+            file.write(prompt["test"].encode())
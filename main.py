@@ -11,15 +11,23 @@
 # It compiles and analyses them, performs unit tests and produces statistics on the models
 # ability to produce efficient code.
 
-from pipeline import compute
+from pipeline import compute, parseArguments
 from analyze import revise
-
-import subprocess
+from archive import Archive, archivePath
 
 if __name__ == '__main__':
-    compute()
-    revise()
-    
-    print("\nCompression of the result in: ./output_pipeline.zip")
-    
-    subprocess.run(['zip', '-r', "output_pipeline", "output"], capture_output=True, text=True)
+    args = parseArguments()
+
+    # The outputs are archived as they complete, the store & the stats once analyzed
+    archive = Archive(archivePath, resume=args.resume)
+
+    try:
+        compute(resume=args.resume, datasetName=args.dataset, prompts=args.prompts, tags=args.tags, shard=args.shard, archive=archive)
+        revise()
+    except BaseException:
+        archive.abort()
+        raise
+
+    archive.close()
+
+    print("\nResult archived in: ./" + archivePath)
@@ -11,58 +11,124 @@
 # It compiles and analyses them, performs unit tests and produces statistics on the models
 # ability to produce efficient code.
 
+import argparse
 import os
-import pandas as pd
 import re
 import requests
 import json
+import queue
 import subprocess
-
+import tempfile
+import threading
+import time
+
+from analyze import itemMetrics
+from backends import Backend, Scheduler
+from cache import cacheKey, getCache, putCache, evictCache, cacheReport
+from collections import Counter
+from dataset import loadDataset, writeTests, testPath
+from compiler import sourceKey, compileSources, writeSlitherExport, writeHardhatArtifacts
+from requests.adapters import HTTPAdapter
+from sampler import AdaptiveSampler
+from sandbox import initSandboxes, prepareSandbox
+from shard import inShard, parseShard
+from stages import Stage, STOP, runStages
+from store import openStore, writeResult, completedItems, iterResults
+from usage import runCommand, UsageSummary, serveProgress
 from yaspin import yaspin
 
 subprocess.run(["solc-select", "install", "0.8.25"], capture_output=True, text=True)
 subprocess.run(["solc-select", "use", "0.8.25"], capture_output=True, text=True)
 
 nbIteration = 1
+# Adaptive iterations: every (model, prompt) runs minIterations, then more while the 95% interval of
+# its compilation, zero vulnerability or perfect tests rate is wider than intervalWidth, up to nbIteration
+adaptiveIterations = False
+minIterations = 3
+intervalWidth = 0.3
+adaptiveErrors = 3       # iterations in error of a (model, prompt) run again, the next ones are left to --resume
 models = ["llama3",
           "gemma",
           "mistral",
           "codegemma",
           "codellama"]
 
-def cleanRepo():    
-    if os.path.exists("output"):
+# Ollama hosts: url, models held (None for all of them), parallel slots (OLLAMA_NUM_PARALLEL) and
+# models kept loaded at once (OLLAMA_MAX_LOADED_MODELS)
+backends = [{"url": "http://localhost:11434", "models": None, "maxRequests": 4, "maxModels": 1}]
+maxRequestsPerModel = 4  # generation requests in flight for a single model, all backends included
+generateAttempts = 2     # a request failing on a backend is sent again to another one
+backendFailures = 3      # consecutive failures setting a backend aside...
+backendCooldown = 5.0    # ...for these seconds, longer after each new failure
+connectTimeout = 10      # seconds to connect to a backend
+readTimeout = 300        # seconds without data from a backend (model load included), maxSeconds more without streaming
+
+# Model affinity: the jobs of the models loaded on a host are handed out first, Ollama keeps the
+# models loaded keepAlive after their last request, and the next model is loaded on a host with room
+# for it (maxModels > 1) as soon as the last job of the current one is handed out
+modelAffinity = True
+keepAlive = "30m"
+preloadModels = True
+
+# Streaming generation: records the time to the first token & the token throughput, and stops the
+# generation once the contract is written or a budget is spent
+streaming = True
+stopAfterCode = True     # stop once a code block holding a contract is closed...
+codeTailTokens = 64      # ...and no other block was opened in the following tokens
+maxTokens = 0            # tokens generated per response, 0 for no limit
+maxSeconds = 0           # seconds of generation per response, 0 for no limit
+
+# Workers of the stages following the generation, every Hardhat worker has its own sandbox
+extractWorkers = 1
+compileWorkers = os.cpu_count() or 1
+slitherWorkers = os.cpu_count() or 1
+testWorkers = max(1, (os.cpu_count() or 1) // 2)
+queueSize = 16           # items waiting between two stages
+
+compileBatchSize = 32    # contracts compiled by a single solc --standard-json run
+compileBatchWait = 1.0   # seconds waited for a batch to fill up
+reuseArtifacts = True    # Slither loads the solc artifacts instead of compiling again...
+testArtifacts = False    # ...and Hardhat too (hardhat test --no-compile), the contract is then tested as compiled by
+                         # the solc of the pipeline instead of the version set in hardhat.config.js
+
+slitherJson = False      # also ask Slither for its findings as JSON on stdout (slither --json -)
+
+gateItems = True         # skip Slither & Hardhat for the contracts that cannot pass them, see gateItem
+
+useCache = True          # reuse the compilation, Slither and test outputs of identical contracts, see cache.py
+
+pruneArchived = False    # removes the responses & contracts from output/ once the archive is closed, see archive.py
+
+progressInterval = 60    # seconds between two progress reports, 0 to disable them
+progressPort = 0         # port of the JSON progress endpoint (http://localhost:port/), 0 to disable it
+
+session = None
+sessionLock = threading.Lock()
+
+def cleanRepo(resume=False):    
+    # A resumed run keeps the output of the previous one
+    if os.path.exists("output") and not resume:
         os.system('rm -rf {}'.format("output"))
     
-    os.mkdir("output")
-    os.mkdir("output/extracted_tests")
+    os.makedirs("output/extracted_tests", exist_ok=True)
 
-def initDataset(dataSetName):
-    df = pd.read_csv(dataSetName, sep=";", encoding='latin1')
-    
-    nbPrompts = df.shape[0]
-    
-    print("input : " + dataSetName + " (" + str(nbPrompts) + " prompts)")
-    
-    dataset = [None] * nbPrompts
+def initDataset(datasetNames, prompts=None, tags=None):
+    dataset, rebuilt = loadDataset(datasetNames, prompts, tags)
+
+    for name in rebuilt:
+        print("input : " + name + (" (compiled)" if rebuilt[name] else ""))
 
+    print(str(len(dataset)) + " prompts")
     print("\t- [NAME]: [CHARS LONG] [TESTS ?]")
-    
-    for i in range(nbPrompts):
-        dataset[i] = [df.iat[i, 0], df.iat[i, 1], df.iat[i, 1]]
-        pattern = r"```js(.*?)```"
-        res = re.findall(pattern, df.iat[i, 1], re.DOTALL)
 
-        if res:
-            content = res[0]
-            with open("output/extracted_tests/" + df.iat[i, 0] + ".js", 'w') as fichier:
-                fichier.write(content)
+    writeTests(dataset)
 
-        print("\t- " + dataset[i][0] + ":  " + str(len(dataset[i][1])) + " "*3 + str(os.path.exists("output/extracted_tests/" + dataset[i][0] + ".js")))
+    for prompt in dataset:
+        print("\t- " + prompt["name"] + ":  " + str(len(prompt["prompt"])) + " "*3 + str(prompt["test"] is not None))
         
     print("\n")
 
-    return dataset
+    return [[prompt["name"], prompt["prompt"]] for prompt in dataset]
 
 def initModels():
     global models
@@ -71,165 +137,717 @@ def initModels():
     
     return models
 
-def fetchOllama(model, prompt, temperature=0.2):
-    url = "http://localhost:11434/api/generate"
+def getSession():
+    global session
+
+    # One pooled session shared by every generation thread, keep-alive connections are reused
+    with sessionLock:
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(backends), pool_maxsize=max(b["maxRequests"] for b in backends))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+    return session
+
+def fetchOllama(url, model, prompt, temperature=0.2):
     headers = {'Content-Type': 'application/json'}
     payload = {
         "model": model,
         "prompt": prompt,
         "stream": False,
+        "keep_alive": keepAlive,
         "options": {
             "temperature": temperature
         }
     }
     
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
+    response = getSession().post(url, headers=headers, data=json.dumps(payload), timeout=(connectTimeout, readTimeout + maxSeconds))
     
     if response.status_code == 200:
         return response.json()
     else:
         response.raise_for_status()
 
-def compute():
+def codeComplete(response):
+    # True when the response is outside of a code block and a closed block holds a contract
+    blocks = response.split("```")
+
+    if len(blocks) < 3 or len(blocks) % 2 == 0:
+        return False
+
+    return any(re.search(r'\bcontract\s+\w+', block) for block in blocks[1::2])
+
+def fetchOllamaStream(url, model, prompt, temperature=0.2):
+    headers = {'Content-Type': 'application/json'}
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": keepAlive,
+        "options": {
+            "temperature": temperature
+        }
+    }
+
+    if maxTokens:
+        payload["options"]["num_predict"] = maxTokens
+
+    start = time.perf_counter_ns()
+    firstToken = None
+    tokens = 0
+    tail = None
+    chunks = []
+    res = None
+    stopReason = None
+
+    # Leaving the with block before the end closes the connection, Ollama then stops the generation
+    with getSession().post(url, headers=headers, data=json.dumps(payload), stream=True, timeout=(connectTimeout, readTimeout)) as response:
+        response.raise_for_status()
+
+        for line in response.iter_lines():
+            if not line:
+                continue
+
+            chunk = json.loads(line)
+
+            # Failure in the middle of the generation, handled as a failed request
+            if chunk.get("error"):
+                raise requests.RequestException("ollama: " + str(chunk["error"]))
+
+            if chunk.get("response"):
+                if firstToken is None:
+                    firstToken = time.perf_counter_ns() - start
+
+                chunks.append(chunk["response"])
+                tokens += 1
+
+            # The stream is read to its end, the connection then goes back to the pool
+            if chunk.get("done"):
+                res = chunk
+                continue
+
+            if stopAfterCode and "`" in chunk.get("response", ""):
+                tail = 0 if codeComplete("".join(chunks)) else None
+            elif tail is not None:
+                tail += 1
+
+            if tail is not None and tail >= codeTailTokens:
+                stopReason = "code"
+                break
+
+            if maxSeconds and time.perf_counter_ns() - start > maxSeconds * 1e9:
+                stopReason = "time"
+                break
+
+    duration = time.perf_counter_ns() - start
+
+    if res is None and stopReason is None:
+        raise requests.RequestException("ollama: stream ended before the end of the generation")
+
+    # Stopped before the end: the fields of the last Ollama message are measured on our side
+    if res is None:
+        res = {"model": model, "done": False, "done_reason": stopReason, "total_duration": duration, "eval_count": tokens}
+
+    res["response"] = "".join(chunks)
+    res["time_to_first_token"] = firstToken
+    res["stream_duration"] = duration
+    res["stream_tokens"] = tokens
+    res["tokens_per_second"] = tokens / ((duration - (firstToken or 0)) / 1e9) if duration > (firstToken or 0) else 0
+
+    return res
+
+def preloadModel(url, model):
+    # A request without prompt loads the model in Ollama, best effort
+    try:
+        getSession().post(url, headers={'Content-Type': 'application/json'}, data=json.dumps({"model": model, "keep_alive": keepAlive}),
+                          timeout=(connectTimeout, readTimeout))
+    except requests.RequestException:
+        pass
+
+class ModelQueue:
+    # Inbox of the generation stage: hands out the oldest job whose model has less than
+    # maxRequestsPerModel requests in flight and a backend free to run it, the job carrying its
+    # backend in item["backend"]. The STOP markers are handed out once every job is taken.
+    # With affinity, the jobs of the models loaded on a free backend go first. preload(model) is
+    # called with the model of the next jobs when the last job of a model is handed out.
+    def __init__(self, limit, scheduler, affinity=False, preload=None):
+        self.limit = limit
+        self.scheduler = scheduler
+        self.affinity = affinity
+        self.preload = preload
+        self.jobs = []
+        self.inFlight = {}
+        self.condition = threading.Condition()
+
+    def put(self, item):
+        with self.condition:
+            self.jobs.append(item)
+            self.condition.notify_all()
+
+    def take(self, loadedOnly):
+        for i in range(len(self.jobs)):
+            item = self.jobs[i]
+
+            if item is STOP:
+                return self.jobs.pop(0) if i == 0 else None
+
+            if self.inFlight.get(item["model"], 0) < self.limit:
+                backend = self.scheduler.acquire(item["model"], loadedOnly=loadedOnly)
+
+                if backend is not None:
+                    item["backend"] = backend
+                    self.inFlight[item["model"]] = self.inFlight.get(item["model"], 0) + 1
+                    self.jobs.pop(i)
+
+                    if self.preload is not None and not any(job is not STOP and job["model"] == item["model"] for job in self.jobs):
+                        following = [job["model"] for job in self.jobs if job is not STOP]
+                        if following:
+                            self.preload(following[0])
+
+                    return item
+
+        return None
+
+    def get(self):
+        with self.condition:
+            while True:
+                for loadedOnly in ([True, False] if self.affinity else [False]):
+                    item = self.take(loadedOnly)
+
+                    if item is not None:
+                        return item
+
+                # Woken up by a release, or when a backend set aside can be used again
+                self.condition.wait(self.scheduler.nextRecovery())
+
+    def retry(self, item, failed):
+        # Another backend for the job after failures on the backends of failed, waits for one to be free
+        with self.condition:
+            while True:
+                backend = self.scheduler.acquire(item["model"], failed)
+
+                if backend is not None:
+                    item["backend"] = backend
+                    return backend
+
+                self.condition.wait(self.scheduler.nextRecovery())
+
+    def releaseBackend(self, item, failed=False, unreachable=False):
+        with self.condition:
+            self.scheduler.release(item.pop("backend"), item["model"], failed, unreachable)
+            self.condition.notify_all()
+
+    def release(self, item):
+        with self.condition:
+            self.inFlight[item["model"]] -= 1
+            self.condition.notify_all()
+
+    def qsize(self):
+        with self.condition:
+            return len(self.jobs)
+
+def itemPath(item):
+    return "output/" + item["model"] + "/" + item["prompt"][0] + "/" + str(item["iteration"])
+
+#STEP 1 : generates the output
+
+def generateItem(item, jobs):
+    failed = []
+
+    try:
+        for attempt in range(generateAttempts):
+            if attempt > 0:
+                jobs.retry(item, failed)
+
+            url = item["backend"].generateUrl()
+
+            try:
+                if streaming:
+                    res = fetchOllamaStream(url, item["model"], item["prompt"][1])
+                else:
+                    res = fetchOllama(url, item["model"], item["prompt"][1])
+            except requests.RequestException as e:
+                failed.append(item["backend"])
+                jobs.releaseBackend(item, failed=True, unreachable=isinstance(e, (requests.ConnectionError, requests.Timeout)))
+
+                if attempt + 1 == generateAttempts:
+                    raise
+                continue
+            except Exception:
+                jobs.releaseBackend(item)
+                raise
+
+            jobs.releaseBackend(item)
+            break
+    finally:
+        jobs.release(item)
+
+    res.pop("context", None)
+    res.pop("model", None)
+
+    item["result"]["response"] = res["response"]
+    
+    with open(itemPath(item) + ".txt", 'w') as fichier:
+        fichier.write(res["response"])
+    
+    res.pop("response")
+
+    item["result"]["promptInfos"] = res
+
+    return item
+
+#STEP 1 bis : cleaning the response
+
+def extractItem(item):
+    with open(itemPath(item) + ".txt", 'r') as file:
+        content = file.read()
+
+    pattern = re.compile(r'```(.*?)```', re.DOTALL)
+    matches = pattern.findall(content)
+
+    with open(itemPath(item) + ".sol", 'w') as output_file:
+        for match in matches:
+            match = match.strip()
+            lines = match.split('\n')
+
+            if lines[0] == "solidity":
+                lines = lines[1:]
+                
+            match = '\n'.join(lines)
+            first_line = lines[0]
+
+            # If the LLM "forgets" to generate the SPDX-License-Identifier line, we write it to avoid compilation warnings
+            if not first_line.startswith('// SPDX-License-Identifier:'):
+                output_file.write('// SPDX-License-Identifier: UNLICENSED\n')
+                
+            output_file.write(match + '\n')
+
+    return item
+
+def readBytes(path):
+    if not os.path.exists(path):
+        return b""
+
+    with open(path, 'rb') as file:
+        return file.read()
+
+def runStep(item, step, inputs, run):
+    # Runs the step, or takes its output from the cache when the same inputs went through the same
+    # toolchain. The path of the item is stored as a placeholder to share the outputs between items.
+    path = itemPath(item)
+    output = None
+
+    if useCache:
+        key = cacheKey(step, inputs)
+        output = getCache(step, key)
+
+    if output is None:
+        result = run()
+        output = {'returnCode': result.returncode,
+                  'stdout': result.stdout.replace(path, "{itemPath}"),
+                  'stderr': result.stderr.replace(path, "{itemPath}")}
+
+        if useCache:
+            putCache(key, output)
+
+    item["result"][step]['returnCode'] = output['returnCode']
+    item["result"][step]['stdout'] = output['stdout'].replace("{itemPath}", path)
+    item["result"][step]['stderr'] = output['stderr'].replace("{itemPath}", path)
+
+    return item
+
+#STEP 2 : Compilation
+
+def applyCompilation(item, output):
+    path = itemPath(item) + ".sol"
+
+    item["result"]["compilation"]['returnCode'] = output['returnCode']
+    item["result"]["compilation"]['stdout'] = output['stdout'].replace(item["sourceKey"], path)
+    item["result"]["compilation"]['stderr'] = output['stderr'].replace(item["sourceKey"], path)
+    item["artifacts"] = output['artifacts']
+
+def compileItems(items):
+    # The contracts of the batch missing from the cache are compiled by a single solc run
+    misses = {}
+
+    for item in items:
+        content = readBytes(itemPath(item) + ".sol")
+        item["sourceKey"] = sourceKey(content)
+        output = None
+
+        if useCache:
+            key = cacheKey("compilation", [content, b"standard-json"])
+            output = getCache("compilation", key)
+
+        if output is not None:
+            applyCompilation(item, output)
+        else:
+            misses.setdefault(item["sourceKey"], [content, []])[1].append(item)
+
+    if misses:
+        outputs = compileSources({k: misses[k][0].decode(errors="replace") for k in misses})
+
+        for k in misses:
+            if useCache:
+                putCache(cacheKey("compilation", [misses[k][0], b"standard-json"]), outputs[k])
+
+            for item in misses[k][1]:
+                applyCompilation(item, outputs[k])
+
+    return items
+
+#STEP 2 bis : gating, the cheap checks skipping Slither & Hardhat
+
+factoryPattern = re.compile(r'getContractFactory\(\s*["\'`]([\w$]+)["\'`]')
+
+def skipStep(item, step, reason, detail):
+    item["result"][step] = {'returnCode': None, 'stdout': "", 'stderr': "skipped: " + detail, 'skipped': reason}
+
+def gateItem(item):
+    # Slither & Hardhat are skipped for a response without code block or a contract that does not
+    # compile, Hardhat for a contract missing the contracts deployed by the test (getContractFactory)
+    source = readBytes(itemPath(item) + ".sol").decode(errors="replace")
+    names = dict.fromkeys(factoryPattern.findall(readBytes(testPath(item["prompt"][0])).decode(errors="replace")))
+
+    if not source.strip():
+        for step in ["slither", "testing"]:
+            skipStep(item, step, "noCode", "no code block in the response")
+        return item
+
+    if item["result"]["compilation"]['returnCode'] != 0:
+        for step in ["slither", "testing"]:
+            skipStep(item, step, "compilation", "the contract does not compile")
+        return item
+
+    missing = [n for n in names if not re.search(r'\b(contract|library)\s+' + re.escape(n) + r'\b', source)]
+
+    if missing:
+        skipStep(item, "testing", "contractName", "contract " + ", ".join(missing) + " expected by the test is not declared")
+        return item
+
+    # Abstract contracts & interfaces compile without bytecode, they cannot be deployed
+    contracts = (item.get("artifacts") or {}).get("contracts", {})
+    undeployable = [n for n in names if not contracts.get(n, {}).get("evm", {}).get("bytecode", {}).get("object")]
+
+    if undeployable:
+        skipStep(item, "testing", "contractFactory", "contract " + ", ".join(undeployable) + " of the test cannot be deployed")
+
+    return item
+
+#STEP 3 : Slither
+
+def slitherFromArtifacts(item, options):
+    with tempfile.TemporaryDirectory() as directory:
+        export = os.path.join(directory, "contract_export.json")
+        writeSlitherExport(export, item["artifacts"], itemPath(item) + ".sol")
+
+        return runCommand(["slither", export] + options)
+
+def slitherItem(item):
+    if "skipped" in item["result"]["slither"]:
+        return item
+
+    options = ["--json", "-"] if slitherJson else []
+
+    if reuseArtifacts and item.get("artifacts") is not None:
+        return runStep(item, "slither", [readBytes(itemPath(item) + ".sol"), " ".join(["export"] + options).encode()],
+                       lambda: slitherFromArtifacts(item, options))
+
+    return runStep(item, "slither", [readBytes(itemPath(item) + ".sol"), " ".join(options).encode()],
+                   lambda: runCommand(["slither", itemPath(item) + ".sol"] + options))
+
+#STEP 4 : Hardhat & testing
+
+def testInSandbox(item, sandboxes):
+    sandbox = sandboxes.get()
+
+    try:
+        prepareSandbox(sandbox, itemPath(item) + ".sol", "output/extracted_tests/" + item["prompt"][0] + ".js")
+
+        if testArtifacts and item.get("artifacts") is not None:
+            writeHardhatArtifacts(sandbox, item["artifacts"])
+
+            return runCommand(["npx", "hardhat", "test", "--no-compile"], cwd = sandbox)
+
+        return runCommand(["npx", "hardhat", "test"], cwd = sandbox)
+    finally:
+        sandboxes.put(sandbox)
+
+def testItem(item, sandboxes):
+    if "skipped" in item["result"]["testing"]:
+        return item
+
+    test = "output/extracted_tests/" + item["prompt"][0] + ".js"
+    noCompile = b"no-compile" if testArtifacts and item.get("artifacts") is not None else b""
+
+    return runStep(item, "testing", [readBytes(itemPath(item) + ".sol"), readBytes(test), noCompile],
+                   lambda: testInSandbox(item, sandboxes))
+
+def initScheduler():
+    return Scheduler([Backend(b["url"], b.get("models"), b.get("maxRequests", 1), b.get("maxModels", 1)) for b in backends], backendCooldown, backendFailures)
+
+def initStages(scheduler):
+    def preload(model):
+        backend = scheduler.preload(model)
+
+        if backend is not None:
+            threading.Thread(target=preloadModel, args=(backend.generateUrl(), model), daemon=True).start()
+
+    jobs = ModelQueue(maxRequestsPerModel, scheduler, modelAffinity, preload if preloadModels else None)
+    sandboxes = initSandboxes(testWorkers)
+
+    return ([Stage("generate", lambda item: generateItem(item, jobs), scheduler.slots(), inbox=jobs),
+             Stage("extract", extractItem, extractWorkers, queueSize),
+             Stage("compile", compileItems, compileWorkers, queueSize, batchSize=compileBatchSize, batchWait=compileBatchWait)]
+            + ([Stage("gate", gateItem, extractWorkers, queueSize)] if gateItems else [])
+            + [Stage("slither", slitherItem, slitherWorkers, queueSize),
+               Stage("test", lambda item: testItem(item, sandboxes), testWorkers, queueSize)])
+
+def newJob(model, prompt, iteration, modelPos, promptPos):
+    return {"model": model, "prompt": prompt, "iteration": iteration, "modelPos": modelPos, "promptPos": promptPos,
+            "result": {"compilation": {}, "slither": {}, "testing": {}}}
+
+def archiveItem(archive, item):
+    for path in [itemPath(item) + ".txt", itemPath(item) + ".sol"]:
+        archive.add(path, remove=pruneArchived)
+
+def compute(resume=False, datasetName="simple_dataset.csv", prompts=None, tags=None, shard=None, archive=None):
     global nbIteration
     
-    cleanRepo()
+    cleanRepo(resume)
+
+    if useCache:
+        print("cache: " + str(evictCache()) + " entries evicted\n")
         
-    dataset = initDataset("simple_dataset.csv")
+    dataset = initDataset([datasetName] if isinstance(datasetName, str) else datasetName, prompts, tags)
     
     models = initModels()
+
+    if archive is not None:
+        for prompt in dataset:
+            archive.add(testPath(prompt[0]))
     
-    print("Iteration per model&prompt = " + str(nbIteration) + "\n")
-    
-    results = {}
+    sampler = AdaptiveSampler(minIterations, nbIteration, intervalWidth, adaptiveErrors) if adaptiveIterations else None
+
+    if sampler is not None:
+        print("Iteration per model&prompt = " + str(sampler.minIterations) + " to " + str(nbIteration) + ", until the intervals are narrower than " + str(intervalWidth*100) + "%\n")
+    else:
+        print("Iteration per model&prompt = " + str(nbIteration) + "\n")
     
-    if (os.path.exists("hardhat_test_env/contracts") == False):
-        os.mkdir("hardhat_test_env/contracts")
-    if (os.path.exists("hardhat_test_env/test") == False):
-        os.mkdir("hardhat_test_env/test")
+    db = openStore()
+    completed = completedItems(db) if resume else set()
+    jobs = []
+    totalDurationModel = {}
+    firstTokenModel = {}
+    loadDurationModel = {}
+    earlyStopModel = {}
+    contratsPos = {}
+    skipped = Counter()
+
+    if resume:
+        print("resume: " + str(len(completed)) + " outputs already completed\n")
+
+        # The outputs of an interrupted run are missing from the archive it left
+        if archive is not None:
+            for m, p, k in sorted(completed):
+                archiveItem(archive, {"model": m, "prompt": [p], "iteration": k})
+
+        # The completed outputs are samples of the adaptive iterations
+        if sampler is not None:
+            for m, p, k, result in iterResults(db, ["slither.stdout", "slither.stderr", "testing.stdout"]):
+                if (m, p, k) in completed:
+                    sampler.record(m, p, k, itemMetrics(result), pending=False)
+
+    if shard is not None:
+        print("shard: " + str(shard[0]) + "/" + str(shard[1]) + " of the outputs\n")
     
     for i in range(len(models)):
         m = models[i]
+        totalDurationModel[m] = []
+        firstTokenModel[m] = []
+        loadDurationModel[m] = 0
+        earlyStopModel[m] = 0
+        contratsPos[m] = 0
 
-        if (os.path.exists("output/" + m) == False):
-            os.mkdir("output/" + m)
-        
-        totalDurationModel = 0
-        contratsPos = 0
-        promptPos = 1
-
-        print("• " + m + " is working!")
-
-        with yaspin(text="Processing...") as spinner:
-            results[m] = {}
-            
-            for j in range(len(dataset)):
-                prompt = dataset[j]
-
-                if (os.path.exists("output/" + m + "/" + prompt[0]) == False):
-                    os.mkdir("output/" + m + "/" + prompt[0])
-                    
-                results[m][prompt[0]] = {}
-                    
-                for k in range(nbIteration):
-                    spinner.text = "Processing... "
-                    
-                    #STEP 1 : generates the output
-
-                    results[m][prompt[0]][k] = {}
-                    results[m][prompt[0]][k]["compilation"] = {}
-                    results[m][prompt[0]][k]["slither"] = {}
-                    results[m][prompt[0]][k]["testing"] = {}
-                    
-                    try:
-                        res = fetchOllama(m, prompt[1])
-
-                        res.pop("context")
-                        res.pop("model")
-
-                        results[m][prompt[0]][k]["response"] = res["response"]
-                        
-                        with open("output/" + m + "/" + prompt[0] + "/" + str(k) + ".txt", 'w') as fichier:
-                            fichier.write(res["response"])
-                        
-                        res.pop("response")
-
-                        results[m][prompt[0]][k]["promptInfos"] = res
-                        
-                        totalDurationModel += res['total_duration']
-                        
-                        #STEP 1 bis : cleaning the response
-                        
-                        with open("output/" + m + "/" + prompt[0] + "/" + str(k) + ".txt", 'r') as file:
-                            content = file.read()
-
-                        pattern = re.compile(r'```(.*?)```', re.DOTALL)
-                        matches = pattern.findall(content)
-
-                        with open("output/" + m + "/" + prompt[0] + "/" + str(k) + ".sol", 'w') as output_file:
-                            for match in matches:
-                                match = match.strip()
-                                lines = match.split('\n')
-
-                                if lines[0] == "solidity":
-                                    lines = lines[1:]
-                                    
-                                match = '\n'.join(lines)
-                                first_line = lines[0]
-                
-                                # If the LLM "forgets" to generate the SPDX-License-Identifier line, we write it to avoid compilation warnings
-                                if not first_line.startswith('// SPDX-License-Identifier:'):
-                                    output_file.write('// SPDX-License-Identifier: UNLICENSED\n')
-                                    
-                                output_file.write(match + '\n')
-                        
-                        #STEP 2 : Compilation
-
-                        result = subprocess.run(["solc", "--gas", "--bin" , "output/" + m + "/" + prompt[0] + "/" + str(k) + ".sol"], capture_output=True, text=True)                        
-                        results[m][prompt[0]][k]["compilation"]['returnCode'] = result.returncode
-                        results[m][prompt[0]][k]["compilation"]['stdout'] = result.stdout
-                        results[m][prompt[0]][k]["compilation"]['stderr'] = result.stderr
-                        
-                        #STEP 3 : Slither
-
-                        result = subprocess.run(["slither", "output/" + m + "/" + prompt[0] + "/" + str(k) + ".sol"], capture_output=True, text=True)
-                        results[m][prompt[0]][k]["slither"]['returnCode'] = result.returncode
-                        results[m][prompt[0]][k]["slither"]['stdout'] = result.stdout
-                        results[m][prompt[0]][k]["slither"]['stderr'] = result.stderr
-                        
-                        #STEP 4 : Hardhat & testing
-
-                        subprocess.run(["rm", "hardhat_test_env/contracts/contract.sol"], capture_output=True, text=True)
-                        subprocess.run(["cp", "output/" + m + "/" + prompt[0] + "/" + str(k) + ".sol","hardhat_test_env/contracts/contract.sol"], capture_output=True, text=True)
-                    
-                        subprocess.run(["rm", "hardhat_test_env/test/verify.js"], capture_output=True, text=True)
-                        subprocess.run(["cp", "output/extracted_tests/" + prompt[0] + ".js","hardhat_test_env/test/verify.js"], capture_output=True, text=True)
-                        
-                        result = subprocess.run(["npx", "hardhat", "test"], cwd = "hardhat_test_env", capture_output=True, text=True)
-                        results[m][prompt[0]][k]["testing"]['returnCode'] = result.returncode
-                        results[m][prompt[0]][k]["testing"]['stdout'] = result.stdout
-                        results[m][prompt[0]][k]["testing"]['stderr'] = result.stderr
-                        
-                        
-                        print("Process finished! contract: [" + str(promptPos) + "/" + str(len(dataset)) + "], iteration: [" + str(k + 1) + "/" + str(nbIteration) + "]")
-                    except:
-                        results[m][prompt[0]][k]["response"] = "error"
-
-                        print("Error! contract: [" + str(promptPos) + "/" + str(len(dataset)) + "], iteration: [" + str(k + 1) + "/" + str(nbIteration) + "]")
-            
-                    contratsPos += 1
-
-                promptPos += 1
-            
-            spinner.text = ""
-            spinner.ok("✔ Done! " + str(contratsPos) + " outputs\n")
-
-            print("Info :\n\ttotalDurationModel= " + str(totalDurationModel/1e9) + " s")
-
-    with open("output/data.json", "w") as file:
-        json.dump(results, file, indent=4)
+        for j in range(len(dataset)):
+            prompt = dataset[j]
+            os.makedirs("output/" + m + "/" + prompt[0], exist_ok=True)
+
+            # With adaptive iterations, the iterations of a (model, prompt) all run in the same shard
+            if sampler is not None:
+                iterations = sampler.next(m, prompt[0]) if shard is None or inShard(m, prompt[0], None, shard) else []
+            else:
+                iterations = [k for k in range(nbIteration) if (m, prompt[0], k) not in completed and (shard is None or inShard(m, prompt[0], k, shard))]
+
+            jobs += [newJob(m, prompt, k, i, j) for k in iterations]
+
+    # The jobs are fed as they come, the adaptive iterations adding jobs as the outputs are scored
+    feed = queue.Queue()
+    pending = len(jobs)
+
+    for job in jobs:
+        feed.put(job)
+
+    if pending == 0:
+        feed.put(None)
+
+    def feedJobs():
+        while True:
+            job = feed.get()
+
+            if job is None:
+                return
+
+            yield job
+
+    scheduler = initScheduler()
+
+    if scheduler.missing(models):
+        raise ValueError("no backend holds the models " + str(scheduler.missing(models)))
+
+    stages = initStages(scheduler)
+
+    print("stages: " + ", ".join(stage.name + " x" + str(stage.workers) for stage in stages) + "\n")
+    print("• " + str(len(models)) + " models are working!")
+
+    summary = UsageSummary()
+    startTime = time.time()
+    lastReport = startTime
+
+    def progress():
+        done = sum(contratsPos.values())
+        elapsed = time.time() - startTime
+
+        return {"outputs": done, "total": len(jobs), "elapsed": elapsed,
+                "remaining": (len(jobs) - done) * elapsed / done if done else None,
+                "stages": {stage.name: stage.snapshot() for stage in stages},
+                "usage": summary.snapshot()}
+
+    server = serveProgress(progressPort, progress) if progressPort else None
+
+    with yaspin(text="Processing...") as spinner:
+        def refresh():
+            nonlocal lastReport
+            state = progress()
+
+            spinner.text = "Processing... " + str(state["outputs"]) + "/" + str(state["total"]) + " outputs"
+
+            # Periodic report of the progress & of the stages, printed above the spinner
+            if progressInterval and time.time() - lastReport >= progressInterval:
+                lastReport = time.time()
+                remaining = " s, about " + "{:.0f}".format(state["remaining"]) + " s remaining" if state["remaining"] is not None else " s"
+
+                spinner.write("Progress: " + str(state["outputs"]) + "/" + str(state["total"]) + " outputs in " + "{:.0f}".format(state["elapsed"]) + remaining
+                              + "".join("\n\t" + stage.report() for stage in stages))
+
+        for item in runStages(stages, feedJobs(), refresh):
+            m = item["model"]
+            prompt = item["prompt"]
+            k = item["iteration"]
+
+            summary.add(m, item.get("usage", {}))
+
+            if "error" in item:
+                result = {"compilation": {}, "slither": {}, "testing": {}, "response": "error", "usage": item.get("usage", {})}
+                writeResult(db, m, prompt[0], k, result, item["modelPos"], item["promptPos"])
+
+                print("Error! model: " + m + ", contract: " + prompt[0] + ", iteration: [" + str(k + 1) + "/" + str(nbIteration) + "] (" + item["error"] + ")")
+            else:
+                result = item["result"]
+                result["usage"] = item.get("usage", {})
+                writeResult(db, m, prompt[0], k, result, item["modelPos"], item["promptPos"])
+
+                infos = item["result"]["promptInfos"]
+                totalDurationModel[m].append(infos['total_duration'])
+                loadDurationModel[m] += infos.get("load_duration", 0)
+
+                if infos.get("time_to_first_token") is not None:
+                    firstTokenModel[m].append(infos["time_to_first_token"])
+                if not infos.get("done", True):
+                    earlyStopModel[m] += 1
+
+                if "skipped" in result["slither"]:
+                    skipped["slither"] += 1
+
+                if "skipped" in result["testing"]:
+                    skipped["testing"] += 1
+                    skipped[result["testing"]["skipped"]] += 1
+
+                if archive is not None:
+                    archiveItem(archive, item)
+
+                print("Process finished! model: " + m + ", contract: " + prompt[0] + ", iteration: [" + str(k + 1) + "/" + str(nbIteration) + "]")
+
+            contratsPos[m] += 1
+            pending -= 1
+
+            # An output in error is no sample of the model, its iteration is run again
+            if sampler is not None:
+                if "error" in item:
+                    sampler.release(m, prompt[0], k)
+                else:
+                    sampler.record(m, prompt[0], k, itemMetrics(result))
+
+                for iteration in sampler.next(m, prompt[0]):
+                    job = newJob(m, prompt, iteration, item["modelPos"], item["promptPos"])
+                    jobs.append(job)
+                    feed.put(job)
+                    pending += 1
+
+            if pending == 0:
+                feed.put(None)
+
+            refresh()
+
+        spinner.text = ""
+        spinner.ok("✔ Done! " + str(len(jobs)) + " outputs\n")
+
+    if server is not None:
+        server.shutdown()
+
+    for stage in stages:
+        print("Stage " + stage.report())
+
+    for backend in scheduler.backends:
+        print("Backend " + backend.report())
+
+    print("Usage per stage (wall, cpu & peak rss of the items):\n" + summary.report())
+
+    if gateItems:
+        print("Gate: " + str(skipped["slither"]) + " Slither & " + str(skipped["testing"]) + " Hardhat runs skipped ("
+              + ", ".join(reason + " " + str(skipped[reason]) for reason in ["noCode", "compilation", "contractName", "contractFactory"]) + ")")
+
+    if sampler is not None:
+        print("Adaptive iterations: " + sampler.report())
+
+    if archive is not None:
+        print("Archive: " + archive.report())
+
+    if useCache:
+        print("Cache: " + cacheReport() + ", " + str(evictCache()) + " entries evicted")
+
+    for m in models:
+        print("Info " + m + " (" + str(contratsPos[m]) + " outputs) :\n\ttotalDurationModel= " + str(sum(totalDurationModel[m])/1e9) + " s")
+        print("\tloadDurationModel= " + str(loadDurationModel[m]/1e9) + " s")
+
+        if firstTokenModel[m]:
+            print("\tmeanTimeToFirstToken= " + str(sum(firstTokenModel[m])/len(firstTokenModel[m])/1e9) + " s, earlyStops= " + str(earlyStopModel[m]) + "/" + str(len(totalDurationModel[m])))
+
+    db.close()
+
+def parseArguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="keep output/ and skip the (model, prompt, iteration) already completed")
+    parser.add_argument("--dataset", nargs="+", default=["simple_dataset.csv"], help="CSV files of the prompts, merged")
+    parser.add_argument("--prompts", nargs="+", help="only run the prompts with these names")
+    parser.add_argument("--tags", nargs="+", help="only run the prompts with one of these tags (simple, intermediate, complex...)")
+    parser.add_argument("--shard", type=parseShard, help="i/N: only run the slice i (from 0 to N-1) of the N slices of the outputs, see shard.py")
+
+    return parser.parse_args()
 
 if __name__ == '__main__':
     print("-"*70 + "\n" + " "*23 + " LLM bench : pipeline.py" + " "*23 + "\n" + "-"*70)
-    compute()
+    args = parseArguments()
+    compute(resume=args.resume, datasetName=args.dataset, prompts=args.prompts, tags=args.tags, shard=args.shard)
     print("-"*70)
@@ -0,0 +1,93 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+from analyze import wilsonInterval
+
+class AdaptiveSampler:
+    # Number of iterations of every (model, prompt): minIterations first, then one more at a time
+    # while the 95% interval of its compilation, zero vulnerability or perfect tests rate (the last
+    # two among the compiled contracts, as in stats.json) is wider than width, up to maxIterations.
+    # An iteration in error is no sample, it is run again, up to maxErrors errors per (model, prompt)
+    # after which the pair is left to --resume.
+    def __init__(self, minIterations, maxIterations, width, maxErrors=3):
+        self.minIterations = min(minIterations, maxIterations)
+        self.maxIterations = maxIterations
+        self.width = width
+        self.maxErrors = maxErrors
+        self.pairs = {}
+
+    def pair(self, model, prompt):
+        if (model, prompt) not in self.pairs:
+            self.pairs[(model, prompt)] = {"used": set(), "pending": 0, "errors": 0, "samples": 0, "compiled": 0, "zeroVulnerability": 0, "perfectTests": 0}
+
+        return self.pairs[(model, prompt)]
+
+    def record(self, model, prompt, iteration, metrics, pending=True):
+        # Sample of an iteration, metrics as computed by analyze.itemMetrics
+        state = self.pair(model, prompt)
+        state["used"].add(iteration)
+        state["samples"] += 1
+
+        if pending:
+            state["pending"] -= 1
+
+        if metrics['compiled']:
+            state["compiled"] += 1
+            state["zeroVulnerability"] += bool(metrics['zeroVulnerability'])
+            state["perfectTests"] += bool(metrics['perfectTests'])
+
+    def release(self, model, prompt, iteration):
+        # Iteration in error, freed for next()
+        state = self.pair(model, prompt)
+        state["used"].discard(iteration)
+        state["pending"] -= 1
+        state["errors"] += 1
+
+    def widths(self, model, prompt):
+        state = self.pair(model, prompt)
+        intervals = [wilsonInterval(state["compiled"], state["samples"]),
+                     wilsonInterval(state["zeroVulnerability"], state["compiled"]),
+                     wilsonInterval(state["perfectTests"], state["compiled"])]
+
+        return [interval[1] - interval[0] for interval in intervals if interval is not None]
+
+    def converged(self, model, prompt):
+        state = self.pair(model, prompt)
+
+        return state["samples"] >= self.minIterations and all(w <= self.width for w in self.widths(model, prompt))
+
+    def next(self, model, prompt):
+        # Iterations to run now for the pair, the missing ones up to minIterations, then one at a time
+        state = self.pair(model, prompt)
+        free = [k for k in range(self.maxIterations) if k not in state["used"]]
+
+        if state["errors"] >= self.maxErrors:
+            iterations = []
+        elif len(state["used"]) < self.minIterations:
+            iterations = free[:self.minIterations - len(state["used"])]
+        elif state["pending"] == 0 and free and not self.converged(model, prompt):
+            iterations = free[:1]
+        else:
+            iterations = []
+
+        state["used"].update(iterations)
+        state["pending"] += len(iterations)
+
+        return iterations
+
+    def report(self):
+        converged = sum(self.converged(m, p) for m, p in self.pairs)
+        samples = sum(state["samples"] for state in self.pairs.values())
+
+        return (str(converged) + "/" + str(len(self.pairs)) + " (model, prompt) converged, " + str(samples) + " iterations instead of "
+                + str(len(self.pairs) * self.maxIterations))
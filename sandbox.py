@@ -0,0 +1,55 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+import os
+import queue
+import shutil
+
+testEnv = "hardhat_test_env"
+sandboxRoot = "sandboxes"
+
+# Files of the Hardhat project copied in every sandbox, node_modules is shared through a symlink
+projectFiles = ["hardhat.config.js", "package.json", "package-lock.json"]
+
+def initSandboxes(nbSandboxes):
+    # Creates nbSandboxes copies of the Hardhat project, returns the pool of their paths
+    if os.path.exists(sandboxRoot):
+        shutil.rmtree(sandboxRoot)
+
+    pool = queue.Queue()
+
+    for i in range(nbSandboxes):
+        path = os.path.join(sandboxRoot, str(i))
+
+        os.makedirs(os.path.join(path, "contracts"))
+        os.makedirs(os.path.join(path, "test"))
+
+        for f in projectFiles:
+            if os.path.exists(os.path.join(testEnv, f)):
+                shutil.copyfile(os.path.join(testEnv, f), os.path.join(path, f))
+
+        if os.path.exists(os.path.join(testEnv, "node_modules")):
+            os.symlink(os.path.abspath(os.path.join(testEnv, "node_modules")), os.path.join(path, "node_modules"))
+
+        pool.put(path)
+
+    return pool
+
+def prepareSandbox(path, contract, test):
+    # Installs the contract & its test in the sandbox in place of the previous ones
+    shutil.copyfile(contract, os.path.join(path, "contracts", "contract.sol"))
+
+    if os.path.exists(test):
+        shutil.copyfile(test, os.path.join(path, "test", "verify.js"))
+    elif os.path.exists(os.path.join(path, "test", "verify.js")):
+        os.remove(os.path.join(path, "test", "verify.js"))
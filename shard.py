@@ -0,0 +1,125 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+# Sharded runs: python3 pipeline.py --shard i/N runs the slice i of the (model, prompt, iteration)
+# matrix, every output falling in one slice whatever the machine, the dataset subset or the resume.
+# The output directories of the shards are then merged into one for analyze.py:
+#   python3 shard.py merge machine0/output machine1/output ...
+# The shards can also run as local processes, each in its own directory of shards/:
+#   python3 shard.py run 4 --dataset complex_dataset.csv
+
+import argparse
+import glob
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+
+from store import openStore, mergeStores, storePath
+
+shardRoot = "shards"
+
+def parseShard(text):
+    try:
+        index, count = [int(n) for n in text.split("/")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected i/N, got " + text)
+
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError("expected 0 <= i < N, got " + text)
+
+    return index, count
+
+def inShard(model, prompt, iteration, shard):
+    # iteration None: slice of the (model, prompt) as a whole
+    h = hashlib.sha256((model + "/" + prompt + ("/" + str(iteration) if iteration is not None else "")).encode()).digest()
+
+    return int.from_bytes(h[:8], "big") % shard[1] == shard[0]
+
+def mergeOutputs(directories, target="output"):
+    # Merges the results stores of the output directories into target/results.db and copies their
+    # other files (responses, contracts & tests) into target
+    os.makedirs(target, exist_ok=True)
+    storeName = os.path.basename(storePath)
+
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            destination = os.path.join(target, os.path.relpath(root, directory))
+            os.makedirs(destination, exist_ok=True)
+
+            for f in files:
+                if not f.startswith(storeName):
+                    shutil.copyfile(os.path.join(root, f), os.path.join(destination, f))
+
+    db = openStore(os.path.join(target, storeName))
+    merged = mergeStores(db, [os.path.join(directory, storeName) for directory in directories])
+    db.close()
+
+    return merged
+
+def runLocal(count, arguments):
+    # Runs the count shards as local processes in shards/<i>, sharing the cache, then merges them
+    root = os.path.abspath(os.path.dirname(__file__))
+    processes = []
+
+    os.makedirs(os.path.join(root, "cache"), exist_ok=True)
+
+    for index in range(count):
+        directory = os.path.join(shardRoot, str(index))
+        os.makedirs(directory, exist_ok=True)
+
+        for f in ["hardhat_test_env", "cache"] + [os.path.basename(d) for d in glob.glob(os.path.join(root, "*.csv"))]:
+            if not os.path.lexists(os.path.join(directory, f)):
+                os.symlink(os.path.join(root, f), os.path.join(directory, f))
+
+        log = open(os.path.join(directory, "pipeline.log"), "w")
+        processes.append((directory, log, subprocess.Popen([sys.executable, os.path.join(root, "pipeline.py"), "--shard", str(index) + "/" + str(count)] + arguments,
+                                                           cwd=directory, stdout=log, stderr=subprocess.STDOUT)))
+
+    failed = []
+
+    for directory, log, process in processes:
+        if process.wait() != 0:
+            failed.append(directory)
+        log.close()
+        print("shard " + directory + ": return code " + str(process.returncode) + ", log in " + os.path.join(directory, "pipeline.log"))
+
+    merged = mergeOutputs([os.path.join(directory, "output") for directory, _, _ in processes if os.path.exists(os.path.join(directory, "output"))])
+    print(str(merged) + " outputs merged in output/")
+
+    return failed
+
+def parseArguments():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge = commands.add_parser("merge", help="merge the output directories of the shards into output/")
+    merge.add_argument("directories", nargs="+")
+    merge.add_argument("--into", default="output", help="merged output directory")
+
+    run = commands.add_parser("run", help="run the shards as local processes, then merge them")
+    run.add_argument("count", type=int)
+
+    return parser.parse_known_args()
+
+if __name__ == '__main__':
+    args, arguments = parseArguments()
+
+    if args.command == "merge":
+        if arguments:
+            sys.exit("unknown arguments " + " ".join(arguments))
+
+        print(str(mergeOutputs(args.directories, args.into)) + " outputs merged in " + args.into)
+    else:
+        sys.exit(1 if runLocal(args.count, arguments) else 0)
@@ -0,0 +1,225 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+import queue
+import threading
+import time
+
+from usage import begin, end
+
+# Marker closing the inbox of a stage, one per worker
+STOP = object()
+
+class Stage:
+    # A step of the pipeline: a pool of worker threads reading items from a bounded inbox, applying
+    # function(item) and forwarding the returned item to the next stage. Items in error are forwarded
+    # untouched so that the remaining stages skip them.
+    # With batchSize > 1, function receives a list of up to batchSize items, gathered for at most
+    # batchWait seconds after the first one, and returns the list of processed items.
+    # The wall time, CPU time & peak RSS spent on every item are recorded in item["usage"][name], a
+    # batch being shared evenly between its items. Its latency is the time from the gathering of the
+    # item to the end of its batch.
+    def __init__(self, name, function, workers=1, queueSize=16, inbox=None, batchSize=1, batchWait=1.0):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.batchSize = batchSize
+        self.batchWait = batchWait
+        self.inbox = inbox if inbox is not None else queue.Queue(maxsize=queueSize)
+        self.next = None
+        self.output = None
+
+        self.lock = threading.Lock()
+        self.threads = []
+        self.alive = 0
+        self.processed = 0
+        self.errors = 0
+        self.busyTime = 0
+        self.cpuTime = 0
+        self.peakRss = None  # of the commands run, None if the stage runs none
+        self.startTime = None
+        self.endTime = None
+
+    def start(self, next=None, output=None):
+        self.next = next
+        self.output = output
+        self.startTime = time.time()
+        self.alive = self.workers
+
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.work, name=self.name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, item):
+        self.inbox.put(item)
+
+    def close(self):
+        for _ in range(self.workers):
+            self.inbox.put(STOP)
+
+    def forward(self, item):
+        if self.next is not None:
+            self.next.put(item)
+        else:
+            self.output.put(item)
+
+    def gather(self):
+        # Next batch of items to process with the time each one was gathered, None once the inbox is closed
+        batch = []
+        gathered = []
+        stop = False
+        deadline = None
+
+        while len(batch) < self.batchSize:
+            try:
+                if deadline is None:
+                    item = self.inbox.get()
+                    deadline = time.time() + self.batchWait
+                else:
+                    item = self.inbox.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                break
+
+            if item is STOP:
+                stop = True
+                break
+
+            # Items in error skip the stage
+            if "error" in item:
+                self.forward(item)
+            else:
+                batch.append(item)
+                gathered.append(time.perf_counter())
+
+        return batch, gathered, stop
+
+    def process(self, batch, gathered):
+        start = time.perf_counter()
+        begin()
+
+        try:
+            if self.batchSize > 1:
+                batch = self.function(batch)
+            else:
+                batch = [self.function(batch[0])]
+        except Exception as e:
+            for item in batch:
+                item["error"] = self.name + ": " + repr(e)
+
+            with self.lock:
+                self.errors += len(batch)
+
+        usage = end()
+        finished = time.perf_counter()
+
+        for item, start in zip(batch, gathered):
+            item.setdefault("usage", {})[self.name] = {"wall": usage["wall"]/len(batch), "latency": finished - start,
+                                                        "cpu": usage["cpu"]/len(batch), "rss": usage["rss"]}
+
+        with self.lock:
+            self.processed += len(batch)
+            self.busyTime += time.perf_counter() - start
+            self.cpuTime += usage["cpu"]
+
+            if usage["rss"] is not None:
+                self.peakRss = max(self.peakRss or 0, usage["rss"])
+
+        for item in batch:
+            self.forward(item)
+
+    def work(self):
+        while True:
+            batch, gathered, stop = self.gather()
+
+            if batch:
+                self.process(batch, gathered)
+
+            if stop:
+                break
+
+        with self.lock:
+            self.alive -= 1
+            last = self.alive == 0
+
+        # The last worker leaving closes the next stage
+        if last:
+            self.endTime = time.time()
+
+            if self.next is not None:
+                self.next.close()
+            else:
+                self.output.put(STOP)
+
+    def depth(self):
+        return self.inbox.qsize()
+
+    def throughput(self):
+        if self.startTime is None:
+            return 0
+
+        elapsed = (self.endTime or time.time()) - self.startTime
+
+        return self.processed / elapsed if elapsed > 0 else 0
+
+    def utilization(self):
+        if self.startTime is None:
+            return 0
+
+        elapsed = (self.endTime or time.time()) - self.startTime
+
+        return self.busyTime / (elapsed * self.workers) if elapsed > 0 else 0
+
+    def summary(self):
+        return self.name + " " + str(self.processed) + " (q" + str(self.depth()) + ")"
+
+    def report(self):
+        return (self.name + ": " + str(self.processed) + " items (" + str(self.errors) + " errors), "
+                + "{:.2f}".format(self.throughput()) + " items/s, "
+                + str(self.workers) + " workers " + "{:.0f}".format(self.utilization()*100) + "% busy, "
+                + "cpu " + "{:.1f}".format(self.cpuTime) + " s, "
+                + ("peak rss " + str(self.peakRss//1024) + " MB, " if self.peakRss is not None else "")
+                + "queue " + str(self.depth()))
+
+    def snapshot(self):
+        return {"processed": self.processed, "errors": self.errors, "queue": self.depth(), "workers": self.workers,
+                "throughput": self.throughput(), "utilization": self.utilization(), "busyTime": self.busyTime,
+                "cpuTime": self.cpuTime, "peakRss": self.peakRss}
+
+def runStages(stages, items, refresh=None):
+    # Chains the stages, feeds them with items and yields the items leaving the last stage.
+    # refresh() is called every second while waiting, to report progress.
+    output = queue.Queue()
+
+    for i in range(len(stages)):
+        stages[i].start(next=stages[i + 1] if i + 1 < len(stages) else None, output=output)
+
+    def feed():
+        for item in items:
+            stages[0].put(item)
+        stages[0].close()
+
+    threading.Thread(target=feed, name="feed", daemon=True).start()
+
+    while True:
+        try:
+            item = output.get(timeout=1)
+        except queue.Empty:
+            if refresh is not None:
+                refresh()
+            continue
+
+        if item is STOP:
+            break
+
+        yield item
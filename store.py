@@ -0,0 +1,205 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+import hashlib
+import json
+import sqlite3
+import sys
+import zlib
+
+# Results of the run: every item is committed as soon as it leaves the pipeline. The items table
+# only holds small records, the response and the outputs of the tools are compressed in the blobs
+# table, stored once per distinct content and loaded only when asked for.
+storePath = "output/results.db"
+
+# Fields of a result moved to the blobs table
+blobFields = ["response",
+              "compilation.stdout", "compilation.stderr",
+              "slither.stdout", "slither.stderr",
+              "testing.stdout", "testing.stderr"]
+
+def openStore(path=storePath, data=None):
+    # data: content of a store (e.g. read from the output archive), opened in memory
+    if data is not None:
+        db = sqlite3.connect(":memory:")
+        # The WAL mode of the file is not available in memory, the header is set back to the rollback journal
+        db.deserialize(data[:18] + b"\x01\x01" + data[20:])
+    else:
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode=WAL")
+
+    db.execute("""CREATE TABLE IF NOT EXISTS items (
+                      model TEXT NOT NULL,
+                      prompt TEXT NOT NULL,
+                      iteration INTEGER NOT NULL,
+                      modelPos INTEGER NOT NULL,
+                      promptPos INTEGER NOT NULL,
+                      status TEXT NOT NULL,
+                      record TEXT NOT NULL,
+                      metrics TEXT,
+                      metricsVersion TEXT,
+                      PRIMARY KEY (model, prompt, iteration))""")
+    # Stores created before the metrics columns
+    columns = [row[1] for row in db.execute("PRAGMA table_info(items)")]
+    for column in ["metrics", "metricsVersion"]:
+        if column not in columns:
+            db.execute("ALTER TABLE items ADD COLUMN " + column + " TEXT")
+
+    db.execute("""CREATE TABLE IF NOT EXISTS blobs (
+                      hash TEXT PRIMARY KEY,
+                      data BLOB NOT NULL)""")
+    db.commit()
+
+    return db
+
+def getField(result, field):
+    for key in field.split(".")[:-1]:
+        result = result.get(key, {})
+
+    return result.get(field.split(".")[-1])
+
+def setField(result, field, value):
+    for key in field.split(".")[:-1]:
+        result = result.setdefault(key, {})
+
+    result[field.split(".")[-1]] = value
+
+def putBlob(db, text):
+    data = text.encode()
+    h = hashlib.sha256(data).hexdigest()
+
+    db.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?)", (h, zlib.compress(data)))
+
+    return h
+
+def getBlob(db, h):
+    row = db.execute("SELECT data FROM blobs WHERE hash = ?", (h,)).fetchone()
+
+    return zlib.decompress(row[0]).decode()
+
+def writeResult(db, model, prompt, iteration, result, modelPos=0, promptPos=0):
+    status = "error" if result["response"] == "error" else "ok"
+    record = json.loads(json.dumps(result))
+
+    # The records in error are kept inline, "response": "error"
+    if status == "ok":
+        for field in blobFields:
+            value = getField(record, field)
+
+            if isinstance(value, str):
+                setField(record, field, {"blob": putBlob(db, value)})
+
+    # A new result drops the metrics computed on the previous one
+    db.execute("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, NULL, NULL)",
+               (model, prompt, iteration, modelPos, promptPos, status, json.dumps(record)))
+    db.commit()
+
+def completedItems(db):
+    # (model, prompt, iteration) already processed, the items in error are run again
+    return set(db.execute("SELECT model, prompt, iteration FROM items WHERE status = 'ok'"))
+
+def storedModels(db):
+    return [row[0] for row in db.execute("SELECT model FROM items GROUP BY model ORDER BY MIN(modelPos), model")]
+
+def iterResults(db, fields=None, model=None, staleMetrics=None):
+    # Lazily yields (model, prompt, iteration, result) in the models, dataset & iteration order.
+    # Only the blob fields listed in fields are loaded (all of them if None), the others are left
+    # as {"blob": hash}. model restricts the results to one model, staleMetrics to the items whose
+    # metrics were not computed with this version.
+    if fields is None:
+        fields = blobFields
+
+    query = "SELECT model, prompt, iteration, record FROM items WHERE 1"
+    parameters = []
+
+    if model is not None:
+        query += " AND model = ?"
+        parameters.append(model)
+
+    if staleMetrics is not None:
+        query += " AND (metricsVersion IS NULL OR metricsVersion != ?)"
+        parameters.append(staleMetrics)
+
+    for model, prompt, iteration, record in db.execute(query + " ORDER BY modelPos, model, promptPos, prompt, iteration", parameters):
+        result = json.loads(record)
+
+        for field in fields:
+            value = getField(result, field)
+
+            if isinstance(value, dict) and "blob" in value:
+                setField(result, field, getBlob(db, value["blob"]))
+
+        yield model, prompt, iteration, result
+
+def writeMetrics(db, rows, version):
+    # rows: (model, prompt, iteration, metrics)
+    db.executemany("UPDATE items SET metrics = ?, metricsVersion = ? WHERE model = ? AND prompt = ? AND iteration = ?",
+                   [(json.dumps(metrics), version, model, prompt, iteration) for model, prompt, iteration, metrics in rows])
+    db.commit()
+
+def iterMetrics(db):
+    # Lazily yields (model, prompt, iteration, metrics) in the models, dataset & iteration order
+    for model, prompt, iteration, metrics in db.execute("SELECT model, prompt, iteration, metrics FROM items ORDER BY modelPos, model, promptPos, prompt, iteration"):
+        yield model, prompt, iteration, json.loads(metrics) if metrics is not None else None
+
+def mergeStores(db, paths):
+    # Adds the items & blobs of the stores in paths (e.g. the stores of the shards of a run), a
+    # completed item is never replaced by an item in error. Returns the number of items merged.
+    merged = 0
+
+    for path in paths:
+        # Brings the store to the current schema
+        openStore(path).close()
+
+        db.execute("ATTACH DATABASE ? AS shard", (path,))
+        db.execute("INSERT OR IGNORE INTO blobs SELECT hash, data FROM shard.blobs")
+        merged += db.execute("""INSERT INTO items
+                                SELECT model, prompt, iteration, modelPos, promptPos, status, record, metrics, metricsVersion FROM shard.items WHERE true
+                                ON CONFLICT (model, prompt, iteration) DO UPDATE SET
+                                    modelPos = excluded.modelPos, promptPos = excluded.promptPos, status = excluded.status,
+                                    record = excluded.record, metrics = excluded.metrics, metricsVersion = excluded.metricsVersion
+                                WHERE items.status != 'ok' OR excluded.status = 'ok'""").rowcount
+        db.commit()
+        db.execute("DETACH DATABASE shard")
+
+    return merged
+
+def exportResults(db, path):
+    # Writes the results in the nested {model: {prompt: {iteration: result}}} layout of data.json,
+    # one item at a time
+    with open(path, "w") as file:
+        file.write("{")
+        currentModel = None
+        currentPrompt = None
+
+        for model, prompt, iteration, result in iterResults(db):
+            if model != currentModel:
+                file.write(("}}, " if currentModel is not None else "") + json.dumps(model) + ": {")
+                currentModel = model
+                currentPrompt = None
+
+            if prompt != currentPrompt:
+                file.write(("}, " if currentPrompt is not None else "") + json.dumps(prompt) + ": {")
+                currentPrompt = prompt
+            else:
+                file.write(", ")
+
+            file.write(json.dumps(str(iteration)) + ": " + json.dumps(result))
+
+        file.write("}}}" if currentModel is not None else "}")
+
+if __name__ == '__main__':
+    # python3 store.py output/data.json : exports the results in the former data.json format
+    db = openStore()
+    exportResults(db, sys.argv[1] if len(sys.argv) > 1 else "output/data.json")
+    db.close()
@@ -0,0 +1,168 @@
+# Software Name : benchmark_pipeline_solidity_llm
+# SPDX-FileCopyrightText: Copyright (c) Orange SA
+# PDX-License-Identifier: GPL-3.0-only
+#
+# This software is distributed under the GNU GENERAL PUBLIC LICENSE
+# see the "LICENSE.txt" file for more details or https://spdx.org/licenses/GPL-3.0-only.html
+#
+# Authors: DURAND Mathis - <mathis.durand@orange.com>
+#          DASPE Etienne - <etienne.daspe@orange.com>
+# Software description: This pipeline generates solidity smart contracts using LLM models.
+# It compiles and analyses them, performs unit tests and produces statistics on the models
+# ability to produce efficient code.
+
+import json
+import os
+import subprocess
+import threading
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Resources used by a stage on an item: wall time & CPU time in seconds, peak RSS in KB. The CPU
+# time is the one of the worker thread plus the one of the commands it ran, the peak RSS the one
+# of the largest command, None for the stages running no command (the pipeline process only has a
+# peak RSS over its lifetime, the same for every item).
+current = threading.local()
+
+def begin():
+    current.wall = time.perf_counter()
+    current.cpu = time.thread_time()
+    current.childrenCpu = 0
+    current.childrenRss = 0
+
+def end():
+    usage = {"wall": time.perf_counter() - current.wall,
+             "cpu": time.thread_time() - current.cpu + current.childrenCpu,
+             "rss": current.childrenRss or None}
+    current.wall = None
+
+    return usage
+
+def peakRss(pid):
+    # High water mark of the resident memory of a running process in KB, None once it exited
+    try:
+        with open("/proc/" + str(pid) + "/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+def processTree(pid):
+    # pid & its running descendants (npx runs Hardhat in a grandchild node process)
+    pids = [pid]
+
+    for p in pids:
+        try:
+            for task in os.listdir("/proc/" + str(p) + "/task"):
+                with open("/proc/" + str(p) + "/task/" + task + "/children") as file:
+                    pids += [int(child) for child in file.read().split()]
+        except (OSError, ValueError):
+            pass
+
+    return pids
+
+def treeRss(pid):
+    # Peak RSS of the largest process of the tree of pid, None once it exited
+    return max([rss for rss in map(peakRss, processTree(pid)) if rss is not None], default=None)
+
+def runCommand(args, input=None, cwd=None):
+    # subprocess.run(args, input=input, cwd=cwd, capture_output=True, text=True), the command is
+    # reaped with wait4 to get its own CPU time, even with other commands running. The ru_maxrss of
+    # wait4 counts the memory of the pipeline copied at fork, the peak RSS is read from /proc for the
+    # command & its descendants while it runs when available.
+    process = subprocess.Popen(args, cwd=cwd, text=True, stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    outputs = {}
+
+    def read(name, stream):
+        outputs[name] = stream.read()
+        stream.close()
+
+    readers = [threading.Thread(target=read, args=("stdout", process.stdout), daemon=True),
+               threading.Thread(target=read, args=("stderr", process.stderr), daemon=True)]
+    for reader in readers:
+        reader.start()
+
+    if input is not None:
+        try:
+            process.stdin.write(input)
+        except BrokenPipeError:
+            pass
+        process.stdin.close()
+
+    rss = None
+
+    for reader in readers:
+        while reader.is_alive():
+            rss = max(rss or 0, treeRss(process.pid) or 0) or None
+            reader.join(0.05)
+
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    if getattr(current, "wall", None) is not None:
+        current.childrenCpu += rusage.ru_utime + rusage.ru_stime
+        current.childrenRss = max(current.childrenRss, rss or rusage.ru_maxrss)
+
+    return subprocess.CompletedProcess(args, process.returncode, outputs["stdout"], outputs["stderr"])
+
+class UsageSummary:
+    # Totals of the usage of the items per stage, and per model & stage
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.models = {}
+
+    def add(self, model, usage):
+        with self.lock:
+            for stage in usage:
+                for totals in [self.stages.setdefault(stage, {}), self.models.setdefault(model, {}).setdefault(stage, {})]:
+                    totals["items"] = totals.get("items", 0) + 1
+                    totals["wall"] = totals.get("wall", 0) + usage[stage]["wall"]
+                    totals["cpu"] = totals.get("cpu", 0) + usage[stage]["cpu"]
+
+                    if usage[stage].get("rss") is not None:
+                        totals["rss"] = max(totals.get("rss", 0), usage[stage]["rss"])
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps({"stages": self.stages, "models": self.models}))
+
+    @staticmethod
+    def line(stage, totals):
+        return (stage + ": wall " + "{:.1f}".format(totals["wall"]) + " s (" + "{:.2f}".format(totals["wall"]/totals["items"]) + " s/item), "
+                + "cpu " + "{:.1f}".format(totals["cpu"]) + " s"
+                + (", peak rss " + str(totals["rss"]//1024) + " MB" if "rss" in totals else ""))
+
+    def report(self):
+        snapshot = self.snapshot()
+        lines = [self.line(stage, snapshot["stages"][stage]) for stage in snapshot["stages"]]
+
+        for model in snapshot["models"]:
+            lines.append(model + ":")
+            lines += ["\t" + self.line(stage, snapshot["models"][model][stage]) for stage in snapshot["models"][model]]
+
+        return "\n".join(lines)
+
+def serveProgress(port, snapshot):
+    # GET http://localhost:port/ returns snapshot() as JSON while the pipeline runs
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            data = json.dumps(snapshot(), indent=2).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, name="progress", daemon=True).start()
+
+    return server